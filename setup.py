@@ -84,6 +84,7 @@ setup(
         # eg:
         #   'rst': ['docutils>=0.11'],
         #   ':python_version=="2.6"': ['argparse'],
+        'numba': ['numba>=0.50'],
     },
     entry_points={
         'console_scripts': [
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from .pitch_control import PlayerSurfaces
+
+
+def params_hash(params):
+    """Short digest of a model parameters dictionary, so that surfaces
+    computed with different parameters never share a cache entry"""
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def data_hash(*arrays):
+    """Short digest of arrays, e.g. the tracking data of a match, so that
+    surfaces of different matches never share a cache entry"""
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype}{array.shape}".encode())
+        digest.update(array)
+    return digest.hexdigest()[:16]
+
+
+def _freeze(pitch_control_dict):
+    # makes the arrays of a cached surface read-only, so that a caller
+    # changing them can't change later hits
+    for value in pitch_control_dict.values():
+        if isinstance(value, PlayerSurfaces):
+            value = value.surfaces
+        if isinstance(value, dict):
+            # per-player surfaces, e.g. PPCFa_pax
+            arrays = value.values()
+        else:
+            arrays = [value]
+        for array in arrays:
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+
+
+class PitchControlCache:
+    """Bounded LRU cache of pitch control surfaces
+
+    Entries are keyed on frame ID, attacking team, grid resolution, a hash
+    of the model parameters and a hash of the match (see key()), so that
+    several matches can share a spill directory. When more than `maxsize`
+    surfaces are held in memory the least recently used one is dropped, or
+    written to `spill_dir` as an .npz file if a spill directory is given.
+    Spilled surfaces are read back (and moved to the front of the LRU) on
+    the next lookup.
+
+    Every lookup of a key returns the same dict, so the arrays are made
+    read-only when they are cached. Copy a surface before changing it.
+
+    Args:
+        maxsize (int, optional): number of surfaces to hold in memory.
+        Defaults to 256.
+        spill_dir (str, optional): directory to spill evicted surfaces to.
+        Defaults to None (evicted surfaces are discarded).
+    """
+
+    def __init__(self, maxsize=256, spill_dir=None):
+        self.maxsize = maxsize
+        self.spill_dir = spill_dir
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def __contains__(self, key):
+        return key in self._surfaces or (
+            self.spill_dir is not None and os.path.exists(self._path(key))
+        )
+
+    @staticmethod
+    def key(
+        frameID,
+        attacking,
+        n_grid_cells_x,
+        params,
+        field_dimen=(106.0, 68.0),
+        match=None,
+    ):
+        """Key of a surface. `match` identifies the tracking data the
+        surface is computed from, e.g. a data_hash() of it"""
+        return (
+            frameID,
+            attacking,
+            n_grid_cells_x,
+            tuple(field_dimen),
+            params_hash(params),
+            match,
+        )
+
+    def get(self, key):
+        """Returns the cached pitch control dict for `key`, or None"""
+        if key in self._surfaces:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return self._surfaces[key]
+        if self.spill_dir is not None and os.path.exists(self._path(key)):
+            pitch_control_dict = self._load(key)
+            self.disk_hits += 1
+            self._insert(key, pitch_control_dict)
+            return pitch_control_dict
+        self.misses += 1
+        return None
+
+    def put(self, key, pitch_control_dict):
+        self._insert(key, pitch_control_dict)
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached surface for `key`, calling `compute()` to
+        produce (and cache) it on a miss"""
+        pitch_control_dict = self.get(key)
+        if pitch_control_dict is None:
+            pitch_control_dict = compute()
+            self.put(key, pitch_control_dict)
+        return pitch_control_dict
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return dict(
+            hits=self.hits,
+            disk_hits=self.disk_hits,
+            misses=self.misses,
+            hit_rate=(self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            size=len(self._surfaces),
+            maxsize=self.maxsize,
+        )
+
+    def clear(self):
+        """Empties the in-memory cache and resets the statistics. Spilled
+        files are left in place."""
+        self._surfaces.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def _insert(self, key, pitch_control_dict):
+        _freeze(pitch_control_dict)
+        self._surfaces[key] = pitch_control_dict
+        self._surfaces.move_to_end(key)
+        while len(self._surfaces) > self.maxsize:
+            old_key, old_dict = self._surfaces.popitem(last=False)
+            if self.spill_dir is not None:
+                self._spill(old_key, old_dict)
+
+    def _path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.spill_dir, f"{name}.npz")
+
+    def _spill(self, key, pitch_control_dict):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        arrays = {}
+        for name, value in pitch_control_dict.items():
+            if isinstance(value, PlayerSurfaces):
+                arrays[name] = value.surfaces
+                arrays[f"{name}.player_ids"] = np.array(value.player_ids)
+            elif isinstance(value, dict):
+                # per-player surfaces, e.g. PPCFa_pax
+                for pid, surface in value.items():
+                    arrays[f"{name}/{pid}"] = surface
+            else:
+                arrays[name] = value
+        np.savez(path, **arrays)
+
+    def _load(self, key):
+        pitch_control_dict = {}
+        with np.load(self._path(key)) as npz:
+            for name in npz.files:
+                if "/" in name:
+                    group, pid = name.split("/", 1)
+                    pitch_control_dict.setdefault(group, {})[pid] = npz[name]
+                elif name.endswith(".player_ids"):
+                    continue
+                elif f"{name}.player_ids" in npz.files:
+                    pitch_control_dict[name] = PlayerSurfaces(
+                        npz[f"{name}.player_ids"].tolist(), npz[name]
+                    )
+                else:
+                    pitch_control_dict[name] = npz[name]
+        return pitch_control_dict
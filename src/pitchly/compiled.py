@@ -0,0 +1,309 @@
+"""
+compiled module
+
+Compiled kernels of the pitch control integration loops, used by the
+"numba" backend of pitch_control (see default_model_params()). They are
+only available when Numba is installed.
+
+The NumPy integrators step every contested cell of a block together and
+have to keep shrinking their working set as cells converge. The kernels
+below integrate one cell at a time with plain loops, so each cell exits as
+soon as it converges, and spread the cells over threads with the GIL
+released.
+
+Functions
+----------
+
+available(): True if Numba is installed.
+
+integrate_pitch_control(): compiled version of the Euler integration in
+pitch_control._integrate_pitch_control(), with the exact or the tabulated
+arrival sigmoid.
+
+integrate_pitch_control_exponential(): compiled version of
+pitch_control._integrate_pitch_control_exponential().
+
+"""
+
+import threading
+
+import numpy as np
+
+# set to True before the first numba pitch control call to keep the
+# compiled kernels on disk between sessions (see Numba's NUMBA_CACHE_DIR
+# for where they go)
+cache_kernels = False
+
+# the numba module once imported, False if it isn't installed. Numba is only
+# imported when a compiled kernel is asked for, so that importing
+# pitch_control with the numpy backend doesn't pay for it
+_numba = None
+_compiled = False
+_compile_lock = threading.Lock()
+
+# kernels to compile, and whether they run their cells in parallel.
+# Helpers come first, so that the kernels calling them see compiled ones
+_KERNELS = [
+    ("_sigmoid", False),
+    ("_euler_cell", False),
+    ("_exponential_cell", False),
+    ("_euler_kernel", True),
+    ("_exponential_kernel", True),
+]
+
+
+def _import_numba():
+    global _numba
+    if _numba is None:
+        try:
+            import numba
+        except ImportError:
+            numba = False
+        _numba = numba
+    return _numba
+
+
+def available():
+    """True if Numba is installed and the compiled kernels can be used"""
+    return bool(_import_numba())
+
+
+def _compile():
+    # swaps the kernels below for their jitted versions, once. Numba then
+    # compiles each of them on its first call
+    global _compiled, prange
+    with _compile_lock:
+        if _compiled:
+            return
+        numba = _import_numba()
+        if not numba:
+            raise ImportError("The compiled pitch control kernels need Numba")
+        prange = numba.prange
+        for name, parallel in _KERNELS:
+            globals()[name] = numba.njit(
+                parallel=parallel, nogil=True, cache=cache_kernels
+            )(globals()[name])
+        _compiled = True
+
+
+# plain range until _compile() runs
+prange = range
+
+
+def _sigmoid(z, table, z_max, table_step):
+    # logistic function, or its interpolation from the values of a
+    # pitch_control.SigmoidTable when one is given
+    if table.size == 0:
+        return 1.0 / (1.0 + np.exp(-z))
+    position = (z + z_max) / table_step
+    if position <= 0.0:
+        return table[0]
+    if position >= table.size - 1:
+        return table[table.size - 1]
+    index = int(position)
+    lower = table[index]
+    return lower + (position - index) * (table[index + 1] - lower)
+
+
+def _euler_cell(
+    tti,
+    ball_travel_time,
+    rate,
+    sigmoid_scale,
+    dt,
+    n_steps,
+    tol,
+    table,
+    z_max,
+    table_step,
+    ppcf,
+):
+    T0 = ball_travel_time - dt
+    ptot = 0.0
+    for i in range(1, n_steps):
+        T = T0 + i * dt
+        uncontrolled = 1.0 - ptot
+        ptot = 0.0
+        for j in range(len(tti)):
+            f = _sigmoid(
+                sigmoid_scale[j] * (T - tti[j]), table, z_max, table_step
+            )
+            ppcf[j] += (uncontrolled * rate[j]) * f
+            ptot += ppcf[j]
+        if 1 - ptot <= tol:
+            break
+    return ptot
+
+
+def _exponential_cell(
+    tti,
+    ball_travel_time,
+    weight,
+    sigmoid_scale,
+    dt,
+    max_int_time,
+    tol,
+    max_drop,
+    ppcf,
+):
+    H = np.empty(len(tti))
+    T = ball_travel_time
+    T_end = T + max_int_time
+    T_next = np.inf
+    for j in range(len(tti)):
+        H[j] = weight[j] * np.log1p(np.exp(sigmoid_scale[j] * (T - tti[j])))
+        T_next = min(T_next, tti[j] - 4.0 / sigmoid_scale[j])
+    T_next = min(max(T, T_next), T_end)
+    dH = np.empty(len(tti))
+    step = dt
+    uncontrolled = 1.0
+    first_step = True
+    while True:
+        dH_tot = 0.0
+        for j in range(len(tti)):
+            H_next = weight[j] * np.log1p(
+                np.exp(sigmoid_scale[j] * (T_next - tti[j]))
+            )
+            dH[j] = H_next - H[j]
+            H[j] = H_next
+            dH_tot += dH[j]
+        next_uncontrolled = uncontrolled * np.exp(-dH_tot)
+        drop = uncontrolled - next_uncontrolled
+        if dH_tot > 0:
+            for j in range(len(tti)):
+                ppcf[j] += drop * (dH[j] / dH_tot)
+        if not first_step:
+            # see pitch_control._integrate_pitch_control_exponential()
+            target = min(max_drop, next_uncontrolled)
+            step = min(
+                max(step * np.sqrt(target / max(drop, 1e-12)), dt / 4), 1.0
+            )
+        first_step = False
+        uncontrolled = next_uncontrolled
+        if uncontrolled <= tol or T_next >= T_end:
+            return 1.0 - uncontrolled
+        T_next = min(T_next + step, T_end)
+
+
+def _euler_kernel(
+    tti,
+    ball_travel_time,
+    rate,
+    sigmoid_scale,
+    dt,
+    n_steps,
+    tol,
+    table,
+    z_max,
+    table_step,
+    PPCF_pax,
+):
+    ptot = np.zeros(len(tti))
+    for cell in prange(len(tti)):
+        ptot[cell] = _euler_cell(
+            tti[cell],
+            ball_travel_time[cell],
+            rate[cell],
+            sigmoid_scale[cell],
+            dt,
+            n_steps,
+            tol,
+            table,
+            z_max,
+            table_step,
+            PPCF_pax[cell],
+        )
+    return ptot
+
+
+def _exponential_kernel(
+    tti,
+    ball_travel_time,
+    weight,
+    sigmoid_scale,
+    dt,
+    max_int_time,
+    tol,
+    max_drop,
+    PPCF_pax,
+):
+    ptot = np.zeros(len(tti))
+    for cell in prange(len(tti)):
+        ptot[cell] = _exponential_cell(
+            tti[cell],
+            ball_travel_time[cell],
+            weight[cell],
+            sigmoid_scale[cell],
+            dt,
+            max_int_time,
+            tol,
+            max_drop,
+            PPCF_pax[cell],
+        )
+    return ptot
+
+
+def _per_cell(values, shape):
+    return np.ascontiguousarray(np.broadcast_to(values, shape), dtype=float)
+
+
+def _report(ptot, tol):
+    failed = 1 - ptot > tol
+    if failed.any():
+        print(
+            "Integration failed to converge in %d cells: %1.3f"
+            % (failed.sum(), ptot[failed].min())
+        )
+
+
+def integrate_pitch_control(
+    tti, ball_travel_time, lambdas, sigmas, params, table=None
+):
+    """Euler integration of equation 3 of Spearman 2018, with the same
+    inputs, output and stopping rule as
+    pitch_control._integrate_pitch_control(). The arrival sigmoid is read
+    from `table` (a pitch_control.SigmoidTable) when one is given."""
+    _compile()
+    dt = params["int_dt"]
+    tti = _per_cell(tti, tti.shape)
+    PPCF_pax = np.zeros(tti.shape)
+    ptot = _euler_kernel(
+        tti,
+        _per_cell(ball_travel_time, len(tti)),
+        _per_cell(lambdas * dt, tti.shape),
+        _per_cell(np.pi / np.sqrt(3.0) / sigmas, tti.shape),
+        dt,
+        np.arange(-dt, params["max_int_time"], dt).size,
+        params["model_converge_tol"],
+        np.empty(0) if table is None else table.values,
+        0.0 if table is None else table.z_max,
+        1.0 if table is None else table.step,
+        PPCF_pax,
+    )
+    _report(ptot, params["model_converge_tol"])
+    return PPCF_pax
+
+
+def integrate_pitch_control_exponential(
+    tti, ball_travel_time, lambdas, sigmas, params
+):
+    """Exponential integration of equation 3 of Spearman 2018, with the same
+    inputs, output and step control as
+    pitch_control._integrate_pitch_control_exponential()"""
+    _compile()
+    tti = _per_cell(tti, tti.shape)
+    sigmoid_scale = _per_cell(np.pi / np.sqrt(3.0) / sigmas, tti.shape)
+    PPCF_pax = np.zeros(tti.shape)
+    ptot = _exponential_kernel(
+        tti,
+        _per_cell(ball_travel_time, len(tti)),
+        _per_cell(lambdas, tti.shape) / sigmoid_scale,
+        sigmoid_scale,
+        params["exponential_int_dt"],
+        params["max_int_time"],
+        params["model_converge_tol"],
+        params["exponential_int_tol"],
+        PPCF_pax,
+    )
+    _report(ptot, params["model_converge_tol"])
+    return PPCF_pax
@@ -1,17 +1,45 @@
 import numpy as np
+import pandas as pd
 import plotly.figure_factory as ff
 import plotly.graph_objects as go
+from scipy import ndimage
 from scipy import signal
 from tqdm.auto import tqdm
 
+from .cache import PitchControlCache
+from .cache import data_hash
 from .params import prm
 from .pitch import Pitch
-from .pitch_control import generate_pitch_control_for_frame
+from .pitch_control import TeamArrays
+from .pitch_control import calculate_pitch_control_at_points
+from .pitch_control import default_model_params
+from .pitch_control import generate_fast_pitch_control_for_teams
+from .pitch_control import generate_pitch_control_for_frames
+from .pitch_control import generate_pitch_control_for_teams
+from .pitch_control import generate_pitch_control_incremental
+from .pitch_control import pitch_grid
+from .pitch_control import space_control_for_frames
+from .store import PitchControlStore
+from .tensors import TensorFrame
+from .tensors import TrackingTensors
 
 
 class TrackingData:
-    def __init__(self, data, metadata):
+    def __init__(
+        self,
+        data,
+        metadata,
+        cache_size=256,
+        cache_dir=None,
+        player_params=None,
+    ):
         self.metadata = metadata
+        # pitch control surfaces already computed, see get_pitch_control()
+        self.pitch_control_cache = PitchControlCache(
+            maxsize=cache_size, spill_dir=cache_dir
+        )
+        # precomputed surfaces on disk, see precompute_pitch_control()
+        self.pitch_control_store = None
         self.home_players = [
             x.player_id for x in self.metadata.teams[0].players
         ]
@@ -24,11 +52,89 @@ class TrackingData:
         self.away_jerseys = [
             x.jersey_no for x in self.metadata.teams[1].players
         ]
+        # jersey number of every player id, to look up individual surfaces
+        self.jerseys = dict(
+            zip(
+                self.home_players + self.away_players,
+                self.home_jerseys + self.away_jerseys,
+            )
+        )
 
-        data = self.metric_coords(data)
-        data = self.flip_direction(data, period=1)
+        # pitch length and width in meters, from the metadata when given
+        self.field_dimen = self._field_dimensions()
+        data = self.normalize_coords(data, self.field_dimen, flip_period=1)
         data = self.calc_player_velocities(data, filter_="moving average")
-        self.data = data
+
+        # positions, velocities and speeds as (frames, players, k) arrays, so
+        # that a frame is a slice instead of a row and column lookup
+        self.tensors = TrackingTensors.from_dataframe(
+            data, self.home_players + self.away_players
+        )
+        # self.data keeps the other columns (period_id, timestamp, ...) and
+        # views the tracking columns from the arrays instead of holding a
+        # second copy of them. The arrays are read-only, so that writing to
+        # those columns raises rather than leaving the two out of step
+        for values in (
+            self.tensors.positions,
+            self.tensors.velocities,
+            self.tensors.speeds,
+            self.tensors.ball,
+        ):
+            values.flags.writeable = False
+        tensor_data = self.tensors.to_dataframe()
+        self.data = pd.concat(
+            [data.drop(columns=tensor_data.columns), tensor_data], axis=1
+        )
+        # identity of the match in pitch control cache and store keys
+        self.match_hash = data_hash(
+            self.tensors.frames,
+            self.tensors.positions,
+            self.tensors.ball,
+            np.array(self.home_players + self.away_players, dtype=str),
+        )
+        self.team_slices = {
+            "Home": self.tensors.columns(self.home_players),
+            "Away": self.tensors.columns(self.away_players),
+        }
+        # columns of each team in self.data, player by player. Matched on the
+        # full "<player_id>_" prefix, so that e.g. player 1 doesn't pick up
+        # the columns of player 10
+        self.team_cols = {
+            side: [
+                col
+                for pid in players
+                for col in self.data.columns
+                if col.startswith(f"{pid}_")
+            ]
+            for side, players in (
+                ("Home", self.home_players),
+                ("Away", self.away_players),
+            )
+        }
+        # sorted timestamps of every period, for frame lookups by time
+        self.timestamp_index = self._index_timestamps()
+        self.set_player_params(player_params)
+
+    def set_player_params(self, player_params):
+        """Individual pitch control model parameters for players
+
+        Args:
+            player_params (dict): {player_id: {param_name: value}} keyed by
+            the ids in metadata.teams[*].players, where param_name is any of
+            "max_player_speed", "reaction_time" and "tti_sigma". Players and
+            parameters that aren't given use the model params. None resets
+            everybody to the model params.
+        """
+        self.player_params = player_params or {}
+        # per-team vectors, in the same order as the team arrays
+        self.individual_params = {
+            "Home": TeamArrays.individual_params(
+                self.home_players, self.player_params
+            ),
+            "Away": TeamArrays.individual_params(
+                self.away_players, self.player_params
+            ),
+        }
 
     def metric_coords(self, data, field_dimen=prm.field_dim):
         x_columns = [c for c in data.columns if c.endswith("_x")]
@@ -38,6 +144,47 @@ class TrackingData:
 
         return data
 
+    def _field_dimensions(self):
+        pitch_dimensions = getattr(self.metadata, "pitch_dimensions", None)
+        length = getattr(pitch_dimensions, "pitch_length", None)
+        width = getattr(pitch_dimensions, "pitch_width", None)
+        if length and width:
+            return (float(length), float(width))
+        return prm.field_dim
+
+    def normalize_coords(self, data, field_dimen=prm.field_dim, flip_period=1):
+        """Converts the _x and _y columns from Metrica units to meters and
+        flips them in one period, in a single pass over the coordinates
+
+        Same as metric_coords() followed by flip_direction(), without the
+        intermediate copies of the x and y column sets. Rows are flipped by
+        their period_id, so the first frame of the other period is left as
+        it is.
+
+        Args:
+            data (pd.DataFrame): tracking data in Metrica units.
+            field_dimen (tuple, optional): pitch length and width in meters.
+            Defaults to prm.field_dim.
+            flip_period (int, optional): period whose coordinates are
+            flipped. Defaults to 1.
+
+        Returns:
+            pd.DataFrame: data, with the coordinates in meters
+        """
+        is_x = data.columns.str.endswith("_x")
+        columns = np.flatnonzero(is_x | data.columns.str.endswith("_y"))
+        # a fresh array (to_numpy() may hand back a read-only view), which the
+        # rest of the transform updates in place. Positional selection keeps
+        # pandas from building an intermediate DataFrame of the columns
+        values = np.subtract(data.iloc[:, columns].to_numpy(dtype=float), 0.5)
+        # x scales by the length and y by minus the width, the flipped
+        # period takes a further -1
+        values *= np.where(is_x[columns], field_dimen[0], -field_dimen[1])
+        sign = np.where(data.period_id.to_numpy() == flip_period, -1.0, 1.0)
+        values *= sign[:, None]
+        data.iloc[:, columns] = values
+        return data
+
     def calc_player_velocities(
         self,
         data,
@@ -47,77 +194,96 @@ class TrackingData:
         polyorder=1,
         maxspeed=12,
     ):
+        """Adds the velocity (_vx, _vy) and speed (_speed) columns of every
+        player to data. Velocities of all players are computed at once, on a
+        single array of every player's positions, separately for each period,
+        and the new columns are attached in a single concat.
+
+        Args:
+            data (pd.DataFrame): tracking data in meters.
+            smoothing (bool, optional): smooth the velocities along time.
+            Defaults to True.
+            filter_ (str, optional): "moving average" or "Savitzky-Golay".
+            Defaults to "moving average".
+            window (int, optional): filter window, in frames. Defaults to 7.
+            polyorder (int, optional): polynomial order of the
+            Savitzky-Golay filter. Defaults to 1.
+            maxspeed (int, optional): raw speeds above this (m/s) are
+            position errors and are dropped. Defaults to 12.
+
+        Returns:
+            pd.DataFrame: data with the velocity columns
+        """
         # Get the player ids
         player_ids = self.home_players + self.away_players
+        # (2, players, frames) positions, with time along contiguous memory
+        # so that the differences and filters below run over each player's
+        # series in turn
+        positions = (
+            data[
+                [f"{pid}_{k}" for k in ("x", "y") for pid in player_ids]
+            ]
+            .to_numpy(float)
+            .T.reshape(2, len(player_ids), len(data))
+        )
         # Calculate the timestep from one frame to the next.
         # Should always be 0.04 within the same half
-        dt = data.timestamp.diff()
-
-        # index of first frame in second half
-        second_half_id = 2
-        second_half_idx = data.period_id.loc[data.period_id == second_half_id].first_valid_index()
-        # estimate velocities for players in team
-        for player in player_ids:  # cycle through players individually
-            # difference player positions in timestep dt to get unsmoothed
-            # estimate of velicity
-            vx = data[player + "_x"].diff() / dt
-            vy = data[player + "_y"].diff() / dt
-
-            if maxspeed > 0:
-                # remove unsmoothed data points that exceed the maximum speed
-                # (these are most likely position errors)
-                raw_speed = np.sqrt(vx ** 2 + vy ** 2)
-                vx[raw_speed > maxspeed] = np.nan
-                vy[raw_speed > maxspeed] = np.nan
-
-            if smoothing:
+        dt = np.diff(data.timestamp.to_numpy(float))
+        velocities = np.empty(positions.shape)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(np.diff(positions, axis=-1), dt, out=velocities[..., 1:])
+        # the first frame of every period has no velocity estimate
+        period_id = data.period_id.to_numpy()
+        starts = np.flatnonzero(np.r_[True, period_id[1:] != period_id[:-1]])
+        velocities[..., starts] = np.nan
+
+        if maxspeed > 0:
+            # remove unsmoothed data points that exceed the maximum speed
+            # (these are most likely position errors)
+            with np.errstate(invalid="ignore"):
+                too_fast = (velocities**2).sum(axis=0) > maxspeed**2
+            np.copyto(velocities, np.nan, where=too_fast)
+
+        if smoothing:
+            if filter_ not in ("Savitzky-Golay", "moving average"):
+                raise ValueError(f"Unknown velocity filter: {filter_}")
+            # smooth every period separately along the time axis
+            for start, stop in zip(starts, np.r_[starts[1:], len(data)]):
                 if filter_ == "Savitzky-Golay":
-                    # calculate first half velocity
-                    vx.iloc[:second_half_idx] = signal.savgol_filter(
-                        vx.iloc[:second_half_idx],
-                        window_length=window,
-                        polyorder=polyorder,
-                    )
-                    vy.iloc[:second_half_idx] = signal.savgol_filter(
-                        vy.iloc[:second_half_idx],
-                        window_length=window,
-                        polyorder=polyorder,
-                    )
-                    # calculate second half velocity
-                    vx.iloc[second_half_idx:] = signal.savgol_filter(
-                        vx.iloc[second_half_idx:],
+                    # the first frame of a period is NaN, which the default
+                    # polynomial fit of the edges can't handle
+                    velocities[..., start:stop] = signal.savgol_filter(
+                        velocities[..., start:stop],
                         window_length=window,
                         polyorder=polyorder,
+                        mode="nearest",
                     )
-                    vy.iloc[second_half_idx:] = signal.savgol_filter(
-                        vy.iloc[second_half_idx:],
-                        window_length=window,
-                        polyorder=polyorder,
-                    )
-                elif filter_ == "moving average":
+                else:
+                    # same as np.convolve(v, ma_window, mode="same")
                     ma_window = np.ones(window) / window
-                    # calculate first half velocity
-                    vx.iloc[:second_half_idx] = np.convolve(
-                        vx.iloc[:second_half_idx], ma_window, mode="same"
+                    velocities[..., start:stop] = ndimage.convolve1d(
+                        velocities[..., start:stop],
+                        ma_window,
+                        mode="constant",
+                        origin=window % 2 - 1,
                     )
-                    vy.iloc[:second_half_idx] = np.convolve(
-                        vy.iloc[:second_half_idx], ma_window, mode="same"
-                    )
-                    # calculate second half velocity
-                    vx.iloc[second_half_idx:] = np.convolve(
-                        vx.iloc[second_half_idx:], ma_window, mode="same"
-                    )
-                    vy.iloc[second_half_idx:] = np.convolve(
-                        vy.iloc[second_half_idx:], ma_window, mode="same"
-                    )
-
-            # put player speed in x,y direction, and total speed back in the
-            # data frame
-            data[player + "_vx"] = vx
-            data[player + "_vy"] = vy
-            data[player + "_speed"] = np.sqrt(vx ** 2 + vy ** 2)
 
-        return data
+        # put player speed in x,y direction, and total speed back in the data
+        # frame, all in one go
+        derived = np.empty((len(player_ids), 3, len(data)))
+        derived[:, :2] = velocities.transpose(1, 0, 2)
+        derived[:, 2] = np.sqrt((velocities**2).sum(axis=0))
+        derived = pd.DataFrame(
+            derived.reshape(-1, len(data)).T,
+            index=data.index,
+            columns=[
+                f"{pid}_{k}"
+                for pid in player_ids
+                for k in ("vx", "vy", "speed")
+            ],
+        )
+        data = data.drop(columns=derived.columns, errors="ignore")
+        return pd.concat([data, derived], axis=1)
 
     def flip_direction(self, data, period=2):
         """
@@ -134,49 +300,174 @@ class TrackingData:
 
         return data
 
-    def get_frameID_from_timestamp(self, timestamp):
-        return self.data.query("timestamp==@timestamp").index[0]
+    def _index_timestamps(self):
+        """Sorted timestamps of every period with the matching frameIDs,
+        and half the frame interval as the default lookup tolerance"""
+        timestamps = self.data.timestamp.to_numpy(dtype=float)
+        period_ids = self.data.period_id.to_numpy()
+        frames = self.data.index.to_numpy()
+        index = {}
+        for period in np.unique(period_ids):
+            rows = np.flatnonzero(period_ids == period)
+            rows = rows[np.argsort(timestamps[rows], kind="stable")]
+            times = timestamps[rows]
+            interval = np.median(np.diff(times)) if len(times) > 1 else 0.0
+            index[period] = (times, frames[rows], interval / 2)
+        return index
+
+    def get_frameIDs_from_timestamps(
+        self, timestamps, period=None, tolerance=None
+    ):
+        """frameIDs of the frames nearest to each timestamp
+
+        Args:
+            timestamps (array): timestamps in seconds.
+            period (int, optional): period to look in. Defaults to None (the
+            nearest frame in any period, the earliest period on ties).
+            tolerance (float, optional): largest accepted distance in seconds
+            to the nearest frame. Defaults to None (half a frame interval).
+
+        Raises:
+            KeyError: if a timestamp has no frame within the tolerance.
+
+        Returns:
+            np.ndarray: frameIDs, one per timestamp
+        """
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=float))
+        best_frames = np.zeros(len(timestamps), dtype=self.data.index.dtype)
+        best_gaps = np.full(len(timestamps), np.inf)
+        for period_id, (times, frames, half_frame) in (
+            self.timestamp_index.items()
+        ):
+            if period is not None and period_id != period:
+                continue
+            after = np.minimum(
+                np.searchsorted(times, timestamps), len(times) - 1
+            )
+            before = np.maximum(after - 1, 0)
+            gap_before = np.abs(timestamps - times[before])
+            gap_after = np.abs(times[after] - timestamps)
+            nearest = np.where(gap_after < gap_before, after, before)
+            gaps = np.minimum(gap_before, gap_after)
+            limit = half_frame if tolerance is None else tolerance
+            better = (gaps <= limit) & (gaps < best_gaps)
+            best_frames[better] = frames[nearest[better]]
+            best_gaps[better] = gaps[better]
+        missing = np.isinf(best_gaps)
+        if missing.any():
+            raise KeyError(
+                f"No frame near timestamps {timestamps[missing].tolist()}"
+            )
+        return best_frames
+
+    def get_frameID_from_timestamp(
+        self, timestamp, period=None, tolerance=None
+    ):
+        """frameID of the frame nearest to timestamp (in seconds), see
+        get_frameIDs_from_timestamps()"""
+        return self.get_frameIDs_from_timestamps(
+            [timestamp], period=period, tolerance=tolerance
+        )[0]
 
     def get_timestamp(self, mins):
+        """Seconds of a game clock string, "mm:ss" (seconds may have
+        decimals) or "mm" """
         if ":" in mins:
-            seconds = (
-                int(mins.split(":")[0]) * 60 + int(mins.split(":")[1]) + 0.04
-            )
-        else:
-            seconds = int(mins) * 60
+            minutes, seconds = mins.split(":")
+            return int(minutes) * 60 + float(seconds)
+        return int(mins) * 60
+
+    def get_timestamps(self, times):
+        """Seconds of many game clock strings at once, see get_timestamp()"""
+        clock = pd.Series(list(times), dtype=str).str.split(":", expand=True)
+        seconds = clock[0].astype(int).to_numpy() * 60.0
+        if clock.shape[1] > 1:
+            seconds += clock[1].fillna("0").astype(float).to_numpy()
         return seconds
 
+    def get_frameIDs_from_times(self, times, period=None, tolerance=None):
+        """frameIDs of many game clock strings ("mm:ss") at once, see
+        get_frameIDs_from_timestamps()"""
+        return self.get_frameIDs_from_timestamps(
+            self.get_timestamps(times), period=period, tolerance=tolerance
+        )
+
     def get_frame_data(self, frameID):
 
         frame_data = self.data.loc[frameID]
 
         return frame_data
 
-    def get_home_cols(self, frame_data):
-        home_cols = []
-        for player in self.home_players:
-            for col in frame_data.keys():
-                if col.startswith(player):
-                    home_cols.append(col)
-        return home_cols
-
-    def get_away_cols(self, frame_data):
-        away_cols = []
-        for player in self.away_players:
-            for col in frame_data.keys():
-                if col.startswith(player):
-                    away_cols.append(col)
-        return away_cols
-
-    def get_team_pitch_control_traces(self, frame_data, player_num=None):
-        pitch_control_dict = generate_pitch_control_for_frame(
-            frame_data,
-            self.get_home_cols(frame_data),
-            self.get_away_cols(frame_data),
+    def get_frame(self, frameID):
+        """Positions, velocities, speeds and ball position in a frame, as
+        views into self.tensors (see TrackingTensors.frame())"""
+        return self.tensors.frame(frameID)
+
+    def _as_frame(self, frame_data):
+        # trace builders take a TensorFrame, or a row of self.data, which is
+        # read for its own values in case they have been changed
+        if isinstance(frame_data, TensorFrame):
+            return frame_data
+        return self.tensors.frame_from_row(frame_data)
+
+    def _is_stored(self, frame):
+        # True if the frame holds the tracking data of its frameID, so that
+        # its surfaces can be cached under that frameID
+        if frame.name not in self.tensors.frame_index:
+            return False
+        stored = self.get_frame(frame.name)
+        return all(
+            np.array_equal(values, given, equal_nan=True)
+            for values, given in zip(stored[1:], frame[1:])
         )
-        if player_num:
-            surface = pitch_control_dict["PPCFa_pax"][str(player_num)]
+
+    def get_team_arrays(self, frame_data, side):
+        """Positions and velocities of a team ("Home" or "Away") in the frame
+        (a TensorFrame or a row of self.data) as TeamArrays"""
+        players = self.home_players if side == "Home" else self.away_players
+        frame = self._as_frame(frame_data)
+        columns = self.team_slices[side]
+        return TeamArrays(
+            players,
+            frame.positions[columns],
+            frame.velocities[columns],
+            **self.individual_params[side],
+        )
+
+    def get_home_cols(self, frame_data=None):
+        """Columns of self.data that belong to the Home team players, e.g.
+        for generate_pitch_control_for_frame(). Precomputed in __init__;
+        frame_data is no longer needed and is ignored"""
+        return list(self.team_cols["Home"])
+
+    def get_away_cols(self, frame_data=None):
+        """Columns of self.data that belong to the Away team players, see
+        get_home_cols()"""
+        return list(self.team_cols["Away"])
+
+    def get_team_pitch_control_traces(
+        self,
+        frame_data,
+        player_num=None,
+        pitch_control_dict=None,
+        pitch_control_mode="exact",
+    ):
+        if player_num is not None:
+            if pitch_control_dict is None:
+                pitch_control_dict = self.get_pitch_control(
+                    frame_data,
+                    return_individual=True,
+                    mode=pitch_control_mode,
+                )
+            # player id or jersey number of an attacking player
+            surface = pitch_control_dict["PPCFa_pax"].surface(
+                str(player_num), jerseys=self.jerseys
+            )
         else:
+            if pitch_control_dict is None:
+                pitch_control_dict = self.get_pitch_control(
+                    frame_data, mode=pitch_control_mode
+                )
             surface = pitch_control_dict["PPCFa"]
 
         trace = go.Heatmap(
@@ -199,15 +490,361 @@ class TrackingData:
         # )
         return [trace]
 
+    def pitch_control_key(
+        self, frameID, attacking, n_grid_cells_x, params, individual=False
+    ):
+        """Key of a surface in self.pitch_control_cache. Individual player
+        params are hashed along with the model params, and the match along
+        with both"""
+        return self.pitch_control_cache.key(
+            frameID,
+            attacking,
+            n_grid_cells_x,
+            dict(
+                params,
+                player_params=self.player_params,
+                individual=individual,
+            ),
+            field_dimen=self.field_dimen,
+            match=self.match_hash,
+        )
+
+    def get_pitch_control(
+        self,
+        frame_data,
+        attacking="Home",
+        params=None,
+        n_grid_cells_x=50,
+        return_individual=False,
+        mode="exact",
+    ):
+        """Pitch control surface for a frame, served from
+        self.pitch_control_cache when it has been computed before
+
+        Args:
+            frame_data (pd.Series): row of self.data for the frame, or its
+            TensorFrame. A row with changed values is computed as given and
+            not cached.
+            attacking (str, optional): team in possession. Defaults to "Home".
+            params (dict, optional): model parameters. Defaults to
+            default_model_params().
+            n_grid_cells_x (int, optional): grid resolution along the pitch
+            length. Defaults to 50.
+            return_individual (bool, optional): If True, also return the
+            surfaces of the attacking players in "PPCFa_pax". Defaults to
+            False.
+            mode (str, optional): "exact" evaluates the full model, "fast" the
+            first-arrival approximation of
+            generate_fast_pitch_control_for_frame(). Defaults to "exact".
+
+        Returns:
+            dict: "PPCFa", "xgrid" and "ygrid" (and "PPCFa_pax") as returned
+            by generate_pitch_control_for_frame()
+        """
+        params = default_model_params() if params is None else params
+        frame = self._as_frame(frame_data)
+        if mode == "fast":
+            key_params = dict(params, mode=mode)
+
+            def compute():
+                return generate_fast_pitch_control_for_teams(
+                    self.get_team_arrays(frame, "Home"),
+                    self.get_team_arrays(frame, "Away"),
+                    params=params,
+                    attacking=attacking,
+                    field_dimen=self.field_dimen,
+                    n_grid_cells_x=n_grid_cells_x,
+                    return_individual=return_individual,
+                )
+
+        elif mode == "exact":
+            key_params = params
+
+            def compute():
+                return generate_pitch_control_for_teams(
+                    self.get_team_arrays(frame, "Home"),
+                    self.get_team_arrays(frame, "Away"),
+                    frame.ball,
+                    params=params,
+                    attacking=attacking,
+                    field_dimen=self.field_dimen,
+                    n_grid_cells_x=n_grid_cells_x,
+                    return_individual=return_individual,
+                )
+
+        else:
+            raise ValueError(f"Unknown pitch control mode: {mode}")
+        if not self._is_stored(frame):
+            # a row with changed values is computed as given, and kept out
+            # of the cache and the store of the frameID
+            return compute()
+        key = self.pitch_control_key(
+            frame.name,
+            attacking,
+            n_grid_cells_x,
+            key_params,
+            individual=return_individual,
+        )
+        store = self.pitch_control_store
+        if mode == "exact" and store is not None and store.key == key[1:]:
+            pitch_control_dict = store.get(frame.name)
+            if pitch_control_dict is not None:
+                return pitch_control_dict
+        return self.pitch_control_cache.get_or_compute(key, compute)
+
+    def get_pitch_control_surfaces(
+        self,
+        frame_range,
+        attacking="Home",
+        params=None,
+        n_grid_cells_x=50,
+        workers=None,
+        incremental=None,
+    ):
+        """Pitch control surfaces for every frame in frame_range
+
+        Args:
+            frame_range (iterable): frameIDs to evaluate.
+            attacking (str, optional): team in possession. Defaults to "Home".
+            params (dict, optional): model parameters. Defaults to
+            default_model_params().
+            n_grid_cells_x (int, optional): grid resolution along the pitch
+            length. Defaults to 50.
+            workers (int, optional): number of processes to spread the frames
+            over. Defaults to None (computed in this process).
+            incremental (float, optional): evaluate the frames as a sequence,
+            only solving again the cells whose times to intercept or ball
+            travel time moved by more than this many seconds (see
+            generate_pitch_control_incremental()). Defaults to None (every
+            frame is solved in full).
+
+        Returns:
+            dict: "PPCFa" (frames, ny, nx) array, "xgrid", "ygrid", "frames"
+        """
+        if incremental is not None:
+            return generate_pitch_control_incremental(
+                self.data,
+                self.home_players,
+                self.away_players,
+                frame_range,
+                params=default_model_params() if params is None else params,
+                attacking=attacking,
+                field_dimen=self.field_dimen,
+                n_grid_cells_x=n_grid_cells_x,
+                tol=incremental,
+                player_params=self.player_params,
+            )
+        return generate_pitch_control_for_frames(
+            self.data,
+            self.home_players,
+            self.away_players,
+            frame_range,
+            params=default_model_params() if params is None else params,
+            attacking=attacking,
+            field_dimen=self.field_dimen,
+            n_grid_cells_x=n_grid_cells_x,
+            workers=workers,
+            player_params=self.player_params,
+        )
+
+    def playing_direction(self, side):
+        """1 if the team ("Home" or "Away") attacks towards positive x, -1
+        otherwise. Read from which half the team starts the match in; after
+        normalize_coords() it holds for the whole match."""
+        x = self.tensors.positions[0, self.team_slices[side], 0]
+        return -1 if np.nanmean(x) > 0 else 1
+
+    def get_space_control(
+        self,
+        frame_range=None,
+        attacking="Home",
+        params=None,
+        n_grid_cells_x=50,
+        chunk_size=250,
+        workers=None,
+    ):
+        """Area controlled by each team, by each team in its final third and
+        by each player, for every frame, in square meters. Surfaces are
+        reduced as they are computed and never kept, so memory stays flat
+        over a whole match (see space_control_for_frames()).
+
+        Args:
+            frame_range (iterable, optional): frameIDs to evaluate. Defaults
+            to None (every frame of the match).
+            attacking (str, optional): team in possession. Defaults to "Home".
+            params (dict, optional): model parameters. Defaults to
+            default_model_params().
+            n_grid_cells_x (int, optional): grid resolution along the pitch
+            length. Defaults to 50.
+            chunk_size (int, optional): frames evaluated at a time. Defaults
+            to 250.
+            workers (int, optional): number of processes to spread the
+            chunks over. Defaults to None (computed in this process).
+
+        Returns:
+            pd.DataFrame: indexed by frameID, with "Home_area", "Away_area",
+            "Home_final_third", "Away_final_third" and a "<player_id>_area"
+            column per player
+        """
+        if frame_range is None:
+            frame_range = self.data.index
+        result = space_control_for_frames(
+            self.data,
+            self.home_players,
+            self.away_players,
+            frame_range,
+            params=default_model_params() if params is None else params,
+            attacking=attacking,
+            field_dimen=self.field_dimen,
+            n_grid_cells_x=n_grid_cells_x,
+            attack_direction=self.playing_direction(attacking),
+            player_params=self.player_params,
+            chunk_size=chunk_size,
+            workers=workers,
+        )
+        sides = [attacking, "Away" if attacking == "Home" else "Home"]
+        columns = {}
+        for k, side in enumerate(sides):
+            columns[f"{side}_area"] = result["team_area"][:, k]
+        for k, side in enumerate(sides):
+            columns[f"{side}_final_third"] = result["final_third"][:, k]
+        for k, pid in enumerate(result["player_ids"]):
+            columns[f"{pid}_area"] = result["player_area"][:, k]
+        space_control = pd.DataFrame(
+            columns, index=pd.Index(result["frames"], name="frameID")
+        )
+        # same column order whichever team is attacking
+        players = self.home_players + self.away_players
+        return space_control[
+            ["Home_area", "Away_area", "Home_final_third", "Away_final_third"]
+            + [f"{pid}_area" for pid in players]
+        ]
+
+    def precompute_pitch_control(
+        self,
+        path,
+        frame_range=None,
+        attacking="Home",
+        params=None,
+        n_grid_cells_x=50,
+        chunk_size=250,
+        workers=None,
+    ):
+        """Computes the pitch control surface of every frame into an on-disk
+        PitchControlStore, which get_pitch_control() (and so plot_frame() and
+        plot_sequence()) then reads from instead of recomputing. Frames that
+        are already in the store are skipped, so an interrupted precompute
+        resumes where it stopped.
+
+        Args:
+            path (str): directory of the store.
+            frame_range (iterable, optional): frameIDs to compute. Defaults to
+            None (every frame of the match).
+            attacking (str, optional): team in possession. Defaults to "Home".
+            params (dict, optional): model parameters. Defaults to
+            default_model_params().
+            n_grid_cells_x (int, optional): grid resolution along the pitch
+            length. Defaults to 50.
+            chunk_size (int, optional): frames computed and written at a time.
+            Defaults to 250.
+            workers (int, optional): number of processes to compute each chunk
+            with. Defaults to None (computed in this process).
+
+        Returns:
+            PitchControlStore: the store, also kept in
+            self.pitch_control_store
+        """
+        params = default_model_params() if params is None else params
+        if frame_range is None:
+            frame_range = self.data.index
+        frames = [int(frameID) for frameID in frame_range]
+        key = self.pitch_control_key(None, attacking, n_grid_cells_x, params)
+        store = PitchControlStore.open(path, mode="r+")
+        if store is None:
+            xgrid, ygrid = pitch_grid(self.field_dimen, n_grid_cells_x)
+            store = PitchControlStore.create(
+                path, frames, xgrid, ygrid, key[1:]
+            )
+        elif store.key != key[1:] or store.frames != frames:
+            raise ValueError(
+                f"{path} holds surfaces of other frames or model settings"
+            )
+        missing = store.missing()
+        for start in tqdm(range(0, len(missing), chunk_size)):
+            chunk = missing[start:start + chunk_size]
+            batch = self.get_pitch_control_surfaces(
+                chunk,
+                attacking=attacking,
+                params=params,
+                n_grid_cells_x=n_grid_cells_x,
+                workers=workers,
+            )
+            store.write(chunk, batch["PPCFa"])
+        self.pitch_control_store = store
+        return store
+
+    def load_pitch_control_store(self, path):
+        """Reads pitch control surfaces from the PitchControlStore in path,
+        as written by precompute_pitch_control() for this match"""
+        store = PitchControlStore.open(path)
+        if store is None:
+            raise FileNotFoundError(f"No pitch control store in {path}")
+        # the match is the last entry of the key, see pitch_control_key()
+        known_frames = pd.Index(store.frames).isin(self.data.index).all()
+        if store.key[-1] != self.match_hash or not known_frames:
+            raise ValueError(f"{path} holds surfaces of another match")
+        self.pitch_control_store = store
+        return store
+
+    def get_pitch_control_at_points(
+        self,
+        target_positions,
+        frames,
+        ball_start_pos=None,
+        attacking="Home",
+        params=None,
+        return_individual=False,
+    ):
+        """Pitch control at arbitrary positions, each at its own frame, e.g.
+        at the end points of every pass in the match
+
+        Args:
+            target_positions (array): (N, 2) positions in metric coordinates.
+            frames (int or array): frameID of every target, or one frameID
+            for all of them.
+            ball_start_pos (array, optional): (N, 2) or (2,) start position of
+            the ball. Defaults to None (ball position in each frame).
+            attacking (str, optional): team in possession. Defaults to "Home".
+            params (dict, optional): model parameters. Defaults to
+            default_model_params().
+            return_individual (bool, optional): If True, also return the
+            contribution of every player. Defaults to False.
+
+        Returns:
+            tuple: as calculate_pitch_control_at_points()
+        """
+        return calculate_pitch_control_at_points(
+            self.data,
+            self.home_players,
+            self.away_players,
+            target_positions,
+            frames,
+            ball_start_pos=ball_start_pos,
+            params=default_model_params() if params is None else params,
+            attacking=attacking,
+            return_individual=return_individual,
+            player_params=self.player_params,
+        )
+
     def position_traces(self, frame_data):
-        player_ids = (self.home_players, self.away_players)
+        frame = self._as_frame(frame_data)
         jerseys = (self.home_jerseys, self.away_jerseys)
 
         position_traces = []
         for i, side in enumerate(["Home", "Away"]):
-            players = player_ids[i]
-            xlocs = [frame_data[f"{player_id}_x"] for player_id in players]
-            ylocs = [frame_data[f"{player_id}_y"] for player_id in players]
+            positions = frame.positions[self.team_slices[side]]
+            xlocs = positions[:, 0]
+            ylocs = positions[:, 1]
 
             traces = go.Scatter(
                 x=xlocs,
@@ -221,14 +858,15 @@ class TrackingData:
         return position_traces
 
     def velocity_traces(self, frame_data):
-        player_ids = (self.home_players, self.away_players)
+        frame = self._as_frame(frame_data)
         velocity_quivers = []
-        for i, side in enumerate(["Home", "Away"]):
-            players = player_ids[i]
-            xlocs = [frame_data[f"{player_id}_x"] for player_id in players]
-            ylocs = [frame_data[f"{player_id}_y"] for player_id in players]
-            xvels = [frame_data[f"{player_id}_vx"] for player_id in players]
-            yvels = [frame_data[f"{player_id}_vy"] for player_id in players]
+        for side in ["Home", "Away"]:
+            positions = frame.positions[self.team_slices[side]]
+            velocities = frame.velocities[self.team_slices[side]]
+            xlocs = positions[:, 0]
+            ylocs = positions[:, 1]
+            xvels = velocities[:, 0]
+            yvels = velocities[:, 1]
 
             trace = ff.create_quiver(
                 x=xlocs,
@@ -244,9 +882,10 @@ class TrackingData:
         return velocity_quivers
 
     def ball_trace(self, frame_data):
+        ball = self._as_frame(frame_data).ball
         ball_trace = go.Scatter(
-            x=[frame_data["ball_x"]],
-            y=[frame_data["ball_y"]],
+            x=[ball[0]],
+            y=[ball[1]],
             marker_size=10,
             marker_opacity=0.8,
             marker_color="white",
@@ -264,6 +903,8 @@ class TrackingData:
         velocities=True,
         ball=True,
         player_num=None,
+        pitch_control_dict=None,
+        pitch_control_mode="exact",
     ):
         """Combines various traces for required plot and returns it
 
@@ -271,15 +912,22 @@ class TrackingData:
             velocities (bool, optional): If True, velocity quivers will be added.
             Defaults to True.
             ball (bool, optional): If True, ball trace is added. Defaults to True.
+            pitch_control_dict (dict, optional): precomputed pitch control
+            surface for the frame. Computed on the fly if not given.
+            pitch_control_mode (str, optional): "exact" or "fast" pitch
+            control (see get_pitch_control()). Defaults to "exact".
         """
-        frame_data = self.get_frame_data(frameID)
+        frame_data = self.get_frame(frameID)
 
         traces = []
 
         if pitch_control:
             traces.extend(
                 self.get_team_pitch_control_traces(
-                    frame_data, player_num=player_num
+                    frame_data,
+                    player_num=player_num,
+                    pitch_control_dict=pitch_control_dict,
+                    pitch_control_mode=pitch_control_mode,
                 )
             )
 
@@ -294,12 +942,67 @@ class TrackingData:
         return traces
 
     def get_frames(
-        self, frame_range, pitch_control=False, velocities=True, ball=True
+        self,
+        frame_range,
+        pitch_control=False,
+        velocities=True,
+        ball=True,
+        workers=None,
+        incremental=None,
+        pitch_control_mode="exact",
     ):
+        surfaces = {}
+        if (
+            pitch_control
+            and pitch_control_mode == "exact"
+            and (workers or incremental is not None)
+        ):
+            # compute the surfaces that aren't cached yet up front, over a
+            # process pool or as one incremental sequence
+            params = default_model_params()
+            store = self.pitch_control_store
+            if store is not None and store.key != self.pitch_control_key(
+                None, "Home", 50, params
+            )[1:]:
+                store = None
+            missing = [
+                frameID
+                for frameID in frame_range
+                if self.pitch_control_key(frameID, "Home", 50, params)
+                not in self.pitch_control_cache
+                and (store is None or frameID not in store)
+            ]
+            if missing:
+                batch = self.get_pitch_control_surfaces(
+                    missing,
+                    params=params,
+                    workers=workers,
+                    incremental=incremental,
+                )
+                for k, frameID in enumerate(missing):
+                    surfaces[frameID] = {
+                        "PPCFa": batch["PPCFa"][k],
+                        "xgrid": batch["xgrid"],
+                        "ygrid": batch["ygrid"],
+                    }
+                    if incremental is not None:
+                        # approximate surfaces stay out of the cache
+                        continue
+                    self.pitch_control_cache.put(
+                        self.pitch_control_key(frameID, "Home", 50, params),
+                        surfaces[frameID],
+                    )
 
         frames = []
         for frameID in tqdm(frame_range):
-            data_ = self.get_traces(frameID, pitch_control, velocities, ball)
+            data_ = self.get_traces(
+                frameID,
+                pitch_control,
+                velocities,
+                ball,
+                pitch_control_dict=surfaces.get(frameID),
+                pitch_control_mode=pitch_control_mode,
+            )
             name_ = f"f{frameID}"
             frames.append(go.Frame(data=data_, name=name_))
 
@@ -317,7 +1020,8 @@ class TrackingData:
         plot_ball=True,
         show_velocities=False,
         player_num=None,
-        show=True
+        show=True,
+        pitch_control_mode="exact",
     ):
 
         if time:
@@ -337,8 +1041,10 @@ class TrackingData:
             pitch_control=pitch_control,
             velocities=show_velocities,
             ball=plot_ball,
+            player_num=player_num,
+            pitch_control_mode=pitch_control_mode,
         )
-        pitch = Pitch()
+        pitch = Pitch(field_dimen=self.field_dimen)
         return pitch.plot_freeze_frame(data, title, pitch_control, show)
 
     def plot_sequence(
@@ -350,14 +1056,13 @@ class TrackingData:
         pitch_control=False,
         show_velocities=True,
         player_num=None,
+        workers=None,
+        incremental=None,
+        pitch_control_mode="exact",
     ):
 
         if t1:
-            t0_ = self.get_timestamp(t0)
-            t1_ = self.get_timestamp(t1)
-
-            f0 = self.get_frameID_from_timestamp(t0_)
-            f1 = self.get_frameID_from_timestamp(t1_)
+            f0, f1 = self.get_frameIDs_from_times([t0, t1])
 
             if ":" in t0:
                 t0 = f"{t0.split(':')[0]}' {t0.split(':')[1]}\""
@@ -370,12 +1075,20 @@ class TrackingData:
         frame_range = range(f0, f1)
 
         data = self.get_traces(
-            frameID=f0, pitch_control=pitch_control, velocities=show_velocities
+            frameID=f0,
+            pitch_control=pitch_control,
+            velocities=show_velocities,
+            pitch_control_mode=pitch_control_mode,
         )
         frames = self.get_frames(
-            frame_range, pitch_control=pitch_control, velocities=show_velocities
+            frame_range,
+            pitch_control=pitch_control,
+            velocities=show_velocities,
+            workers=workers,
+            incremental=incremental,
+            pitch_control_mode=pitch_control_mode,
         )
-        pitch = Pitch()
+        pitch = Pitch(field_dimen=self.field_dimen)
         return pitch.plot_frames_sequence(
             data, frames, frame_range, title, pitch_control
         )
@@ -6,15 +6,16 @@ from .params import prm
 
 
 class Pitch:
-    def __init__(self):
+    def __init__(self, field_dimen=prm.field_dim):
         # ALL DIMENSIONS IN m
+        self.field_dimen = field_dimen  # length and width of the pitch
         self.border_dimen = (
             3,
             3,
         )  # include a border arround of the field of width 3m
         self.meters_per_yard = 0.9144  # unit conversion from yards to meters
-        self.half_pitch_length = prm.field_dim[0] / 2.0  # length of half pitch
-        self.half_pitch_width = prm.field_dim[1] / 2.0  # width of half pitch
+        self.half_pitch_length = field_dimen[0] / 2.0  # length of half pitch
+        self.half_pitch_width = field_dimen[1] / 2.0  # width of half pitch
         self.signs = [-1, 1]
         # Soccer field dimensions typically defined in yards, so we need to
         # convert to meters
@@ -196,8 +197,8 @@ class Pitch:
             )
 
             # set axis limits
-        xmax = prm.field_dim[0] / 2.0 + self.border_dimen[0]
-        ymax = prm.field_dim[1] / 2.0 + self.border_dimen[1]
+        xmax = self.field_dimen[0] / 2.0 + self.border_dimen[0]
+        ymax = self.field_dimen[1] / 2.0 + self.border_dimen[1]
 
         layout = go.Layout(
             title={
@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy as np
+
+
+class PitchControlStore:
+    """On-disk store of precomputed pitch control surfaces for a match
+
+    Surfaces live in a memory-mapped (frames, ny, nx) float32 `.npy` file,
+    so a single frame is read without loading the rest of the match. A JSON
+    header lists the frame IDs in row order along with the grid and the key
+    the surfaces were computed with (see PitchControlCache.key()), and a
+    second memory-mapped array flags the rows that have been written. A
+    precompute that is interrupted therefore picks up where it stopped.
+
+    Use create() to start a new store and open() to read an existing one.
+    Surfaces returned by get() are read-only views into the file.
+
+    Args:
+        path (str): directory holding the store.
+        mode (str, optional): "r" to read the surfaces, "r+" to also write
+        them. Defaults to "r".
+    """
+
+    header_file = "header.json"
+    surfaces_file = "surfaces.npy"
+    done_file = "done.npy"
+
+    def __init__(self, path, mode="r"):
+        self.path = path
+        with open(os.path.join(path, self.header_file)) as f:
+            header = json.load(f)
+        self.frames = header["frames"]
+        self.xgrid = np.asarray(header["xgrid"])
+        self.ygrid = np.asarray(header["ygrid"])
+        self.key = tuple(
+            tuple(k) if isinstance(k, list) else k for k in header["key"]
+        )
+        self.rows = {frameID: row for row, frameID in enumerate(self.frames)}
+        self.surfaces = np.load(
+            os.path.join(path, self.surfaces_file), mmap_mode=mode
+        )
+        self.done = np.load(os.path.join(path, self.done_file), mmap_mode=mode)
+
+    @classmethod
+    def create(cls, path, frames, xgrid, ygrid, key):
+        """Creates an empty store for `frames` on the given grid
+
+        Args:
+            path (str): directory to create the store in.
+            frames (iterable): frameIDs, in the order they are stored.
+            xgrid (array): grid positions along the pitch length.
+            ygrid (array): grid positions along the pitch width.
+            key (tuple): key of the surfaces, without the frameID.
+
+        Returns:
+            PitchControlStore: the new store
+        """
+        os.makedirs(path, exist_ok=True)
+        frames = [int(frameID) for frameID in frames]
+        np.lib.format.open_memmap(
+            os.path.join(path, cls.surfaces_file),
+            mode="w+",
+            dtype=np.float32,
+            shape=(len(frames), len(ygrid), len(xgrid)),
+        ).flush()
+        np.save(os.path.join(path, cls.done_file), np.zeros(len(frames), bool))
+        # the header goes last, a store without one is incomplete
+        header = dict(
+            frames=frames,
+            xgrid=np.asarray(xgrid).tolist(),
+            ygrid=np.asarray(ygrid).tolist(),
+            key=list(key),
+        )
+        with open(os.path.join(path, cls.header_file), "w") as f:
+            json.dump(header, f)
+        return cls(path, mode="r+")
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """Opens the store in `path` ("r" to read, "r+" to also write), or
+        returns None if there is none"""
+        if not os.path.exists(os.path.join(path, cls.header_file)):
+            return None
+        return cls(path, mode=mode)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, frameID):
+        row = self.rows.get(frameID)
+        return row is not None and bool(self.done[row])
+
+    def missing(self):
+        """frameIDs that haven't been written yet"""
+        return [self.frames[row] for row in np.flatnonzero(~self.done)]
+
+    def get(self, frameID):
+        """Pitch control dict ("PPCFa", "xgrid", "ygrid") of a frame, or None
+        if it hasn't been written"""
+        if frameID not in self:
+            return None
+        surface = self.surfaces[self.rows[frameID]]
+        # changing it in place would otherwise change the file
+        surface.flags.writeable = False
+        return {
+            "PPCFa": surface,
+            "xgrid": self.xgrid,
+            "ygrid": self.ygrid,
+        }
+
+    def write(self, frames, surfaces):
+        """Writes the (len(frames), ny, nx) surfaces of `frames` and flags
+        them as done once they are on disk"""
+        rows = [self.rows[frameID] for frameID in frames]
+        self.surfaces[rows] = surfaces
+        self.surfaces.flush()
+        self.done[rows] = True
+        self.done.flush()
@@ -0,0 +1,165 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# the arrays of one frame, as views into TrackingTensors. `name` is the
+# frameID, as for a row of the tracking DataFrame
+TensorFrame = namedtuple(
+    "TensorFrame", ["name", "positions", "velocities", "speeds", "ball"]
+)
+
+
+def _labels(player_ids, suffixes):
+    # wide DataFrame columns of the players, player by player
+    return [f"{pid}_{k}" for pid in player_ids for k in suffixes]
+
+
+class TrackingTensors:
+    """Tracking data of a match as contiguous arrays
+
+    Positions and velocities are (frames, players, 2) arrays, speeds
+    (frames, players) and the ball (frames, 2), with players in the order of
+    `player_ids` and frames in the order of `frames`. `frame_index` and
+    `player_index` map frameIDs and player ids to their row and column, so a
+    frame is a set of zero-copy slices (see frame()) instead of a row lookup
+    in the DataFrame followed by a string lookup per column.
+
+    Use from_dataframe() to build them from the wide tracking DataFrame and
+    to_dataframe() for a DataFrame view of them.
+
+    Args:
+        frames (array): frameIDs, in row order.
+        player_ids (list): player ids, in column order.
+        positions (array): (frames, players, 2) x, y positions.
+        velocities (array): (frames, players, 2) vx, vy velocities.
+        speeds (array): (frames, players) speeds.
+        ball (array): (frames, 2) ball positions.
+    """
+
+    def __init__(
+        self, frames, player_ids, positions, velocities, speeds, ball
+    ):
+        self.frames = np.asarray(frames)
+        self.player_ids = list(player_ids)
+        self.positions = np.ascontiguousarray(positions, dtype=float)
+        self.velocities = np.ascontiguousarray(velocities, dtype=float)
+        self.speeds = np.ascontiguousarray(speeds, dtype=float)
+        self.ball = np.ascontiguousarray(ball, dtype=float)
+        self.frame_index = {
+            frameID: row for row, frameID in enumerate(self.frames.tolist())
+        }
+        self.player_index = {pid: k for k, pid in enumerate(self.player_ids)}
+
+    @classmethod
+    def from_dataframe(cls, data, player_ids):
+        """Gathers the _x, _y, _vx, _vy and _speed columns of every player
+        and the ball_x and ball_y columns of the tracking DataFrame
+
+        Args:
+            data (pd.DataFrame): tracking data indexed by frameID.
+            player_ids (list): ids of the players to gather.
+
+        Returns:
+            TrackingTensors: the arrays
+        """
+
+        def gather(suffixes):
+            labels = _labels(player_ids, suffixes)
+            columns = data.columns.get_indexer(labels)
+            if (columns < 0).any():
+                missing = [c for c, i in zip(labels, columns) if i < 0]
+                raise KeyError(
+                    f"Columns not found in the tracking data: {missing}"
+                )
+            values = data.iloc[:, columns].to_numpy(dtype=float)
+            return values.reshape(len(data), len(player_ids), len(suffixes))
+
+        return cls(
+            data.index,
+            player_ids,
+            gather(("x", "y")),
+            gather(("vx", "vy")),
+            gather(("speed",))[..., 0],
+            data[["ball_x", "ball_y"]].to_numpy(dtype=float),
+        )
+
+    def __len__(self):
+        return len(self.frames)
+
+    def row(self, frameID):
+        """Row of a frameID in the arrays"""
+        try:
+            return self.frame_index[frameID]
+        except KeyError:
+            raise KeyError(f"Frame not in the tracking data: {frameID}")
+
+    def columns(self, player_ids):
+        """Columns of the given players in the arrays, as a slice when they
+        are contiguous (so that indexing with it doesn't copy)"""
+        columns = [self.player_index[pid] for pid in player_ids]
+        if columns and columns == list(range(columns[0], columns[-1] + 1)):
+            return slice(columns[0], columns[-1] + 1)
+        return np.array(columns, dtype=int)
+
+    def frame(self, frameID):
+        """Views of the arrays at a frame, as a TensorFrame"""
+        row = self.row(frameID)
+        return TensorFrame(
+            frameID,
+            self.positions[row],
+            self.velocities[row],
+            self.speeds[row],
+            self.ball[row],
+        )
+
+    def frame_from_row(self, row):
+        """TensorFrame of a row of the wide DataFrame (see to_dataframe()),
+        read from the values of the row rather than from the arrays"""
+
+        def gather(suffixes):
+            values = row[_labels(self.player_ids, suffixes)]
+            return values.to_numpy(dtype=float).reshape(
+                len(self.player_ids), len(suffixes)
+            )
+
+        return TensorFrame(
+            row.name,
+            gather(("x", "y")),
+            gather(("vx", "vy")),
+            gather(("speed",))[:, 0],
+            row[["ball_x", "ball_y"]].to_numpy(dtype=float),
+        )
+
+    def to_dataframe(self):
+        """Wide DataFrame with the _x and _y, then the _vx and _vy, then the
+        _speed columns of every player and the ball_x and ball_y columns,
+        indexed by frameID
+
+        The columns are views of the arrays rather than a copy of them.
+        """
+        index = pd.Index(self.frames)
+        n_frames = len(self)
+        blocks = [
+            (self.positions, ("x", "y")),
+            (self.velocities, ("vx", "vy")),
+            (self.speeds, ("speed",)),
+        ]
+        views = [
+            pd.DataFrame(
+                values.reshape(n_frames, -1),
+                index=index,
+                columns=_labels(self.player_ids, suffixes),
+                copy=False,
+            )
+            for values, suffixes in blocks
+        ]
+        views.append(
+            pd.DataFrame(
+                self.ball,
+                index=index,
+                columns=["ball_x", "ball_y"],
+                copy=False,
+            )
+        )
+        return pd.concat(views, axis=1)
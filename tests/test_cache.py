@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from pitchly.cache import PitchControlCache
+from pitchly.pitch_control import PlayerSurfaces
+from pitchly.pitch_control import default_model_params
+
+
+def surface(value):
+    return {
+        "PPCFa": np.full((2, 3), value),
+        "xgrid": np.arange(3.0),
+        "ygrid": np.arange(2.0),
+        "PPCFa_pax": PlayerSurfaces(["P1"], np.full((1, 2, 3), value / 2)),
+    }
+
+
+def test_key_depends_on_params():
+    params = default_model_params()
+    other = dict(params, lambda_att=3.0)
+    assert PitchControlCache.key(1, "Home", 50, params) == PitchControlCache.key(
+        1, "Home", 50, default_model_params()
+    )
+    assert PitchControlCache.key(1, "Home", 50, params) != PitchControlCache.key(
+        1, "Home", 50, other
+    )
+
+
+def test_lru_eviction_and_stats():
+    cache = PitchControlCache(maxsize=2)
+    cache.put("a", surface(0.1))
+    cache.put("b", surface(0.2))
+    assert cache.get("a") is not None  # "b" is now least recently used
+    cache.put("c", surface(0.3))
+    assert cache.get("b") is None
+    assert len(cache) == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_evicted_surfaces_spill_to_disk(tmp_path):
+    cache = PitchControlCache(maxsize=1, spill_dir=str(tmp_path))
+    cache.put("a", surface(0.1))
+    cache.put("b", surface(0.2))
+    assert len(list(tmp_path.iterdir())) == 1
+    assert "a" in cache
+    restored = cache.get("a")
+    np.testing.assert_array_equal(restored["PPCFa"], surface(0.1)["PPCFa"])
+    assert isinstance(restored["PPCFa_pax"], PlayerSurfaces)
+    assert restored["PPCFa_pax"].player_ids == ["P1"]
+    np.testing.assert_array_equal(
+        restored["PPCFa_pax"]["P1"], surface(0.1)["PPCFa_pax"]["P1"]
+    )
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_get_or_compute_only_computes_once():
+    cache = PitchControlCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return surface(0.5)
+
+    cache.get_or_compute("k", compute)
+    cache.get_or_compute("k", compute)
+    assert len(calls) == 1
+
+
+def test_cached_surfaces_are_read_only(tmp_path):
+    cache = PitchControlCache(maxsize=1, spill_dir=str(tmp_path))
+    cache.put("a", surface(0.1))
+    with pytest.raises(ValueError):
+        cache.get("a")["PPCFa"][0, 0] = 1.0
+    with pytest.raises(ValueError):
+        cache.get("a")["PPCFa_pax"]["P1"][0, 0] = 1.0
+    # and so are surfaces read back from the spill directory
+    cache.put("b", surface(0.2))
+    with pytest.raises(ValueError):
+        cache.get("a")["PPCFa"][0, 0] = 1.0
+    np.testing.assert_array_equal(cache.get("a")["PPCFa"], 0.1)
@@ -0,0 +1,313 @@
+import warnings
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pitchly.metrica import TrackingData
+
+
+def make_match(n_frames=50, n_players=11, seed=0):
+    """Random walk tracking data in Metrica units with two periods"""
+    rng = np.random.default_rng(seed)
+    half = n_frames // 2
+    data = {
+        "period_id": np.r_[np.ones(half, int), np.full(n_frames - half, 2)],
+        "timestamp": np.r_[
+            np.arange(half) * 0.04, np.arange(n_frames - half) * 0.04
+        ],
+    }
+    teams = []
+    for team in ("H", "A"):
+        players = []
+        for k in range(n_players):
+            pid = f"{team}{k:02d}"
+            start = rng.uniform(0.1, 0.9, size=2)
+            steps = rng.normal(0, 0.0015, size=(n_frames, 2))
+            track = start + np.cumsum(steps, axis=0)
+            data[f"{pid}_x"] = track[:, 0]
+            data[f"{pid}_y"] = track[:, 1]
+            players.append(SimpleNamespace(player_id=pid, jersey_no=k + 1))
+        teams.append(SimpleNamespace(players=players))
+    data["ball_x"] = np.linspace(0.3, 0.7, n_frames)
+    data["ball_y"] = np.linspace(0.4, 0.6, n_frames)
+    return pd.DataFrame(data), SimpleNamespace(teams=teams)
+
+
+@pytest.fixture
+def tracking():
+    return TrackingData(*make_match())
+
+
+def test_parallel_frames_match_serial(tracking):
+    frame_range = range(20, 26)
+    serial = tracking.get_frames(frame_range, pitch_control=True)
+    tracking.pitch_control_cache.clear()
+    parallel = tracking.get_frames(frame_range, pitch_control=True, workers=2)
+    assert [f.name for f in parallel] == [f.name for f in serial]
+    for f_serial, f_parallel in zip(serial, parallel):
+        np.testing.assert_allclose(
+            np.asarray(f_parallel.data[0].z), np.asarray(f_serial.data[0].z)
+        )
+
+
+def test_velocities_match_per_player_moving_average(tracking):
+    data = tracking.data
+    first = data.period_id == 1
+    for pid in ("H00", "A07"):
+        for axis in ("x", "y"):
+            raw = data.loc[first, f"{pid}_{axis}"].diff() / 0.04
+            expected = np.convolve(raw, np.ones(7) / 7, mode="same")
+            np.testing.assert_allclose(
+                data.loc[first, f"{pid}_v{axis}"], expected
+            )
+    # the first frames of the second period don't look across the break
+    second = data.index[data.period_id == 2]
+    assert np.isnan(data.loc[second[0], "H00_vx"])
+    assert not np.isnan(data.loc[second[10], "H00_vx"])
+
+
+def test_velocities_are_added_in_one_go():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.PerformanceWarning)
+        TrackingData(*make_match())
+
+
+def test_team_columns_with_prefixed_player_ids():
+    data, metadata = make_match()
+    renames = {"H00": "H1", "H01": "H19"}
+    data = data.rename(columns=lambda c: renames.get(c[:3], c[:3]) + c[3:])
+    for player in metadata.teams[0].players:
+        player.player_id = renames.get(player.player_id, player.player_id)
+    tracking = TrackingData(data, metadata)
+    home_cols = tracking.get_home_cols()
+    assert [c for c in home_cols if c.startswith("H1_")] == [
+        f"H1_{k}" for k in ("x", "y", "vx", "vy", "speed")
+    ]
+    assert len(set(home_cols)) == len(home_cols) == 5 * 11
+    assert not set(home_cols) & set(tracking.get_away_cols())
+
+
+def test_frame_lookup_by_timestamp(tracking):
+    # both periods of make_match() start their clock at 0
+    assert tracking.get_frameID_from_timestamp(0.4) == 10
+    assert tracking.get_frameID_from_timestamp(0.4, period=2) == 35
+    assert tracking.get_frameID_from_timestamp(0.41) == 10
+    assert tracking.get_frameID_from_timestamp(0.43) == 11
+    with pytest.raises(KeyError):
+        tracking.get_frameID_from_timestamp(5.0)
+    assert tracking.get_frameID_from_timestamp(5.0, tolerance=np.inf) == 24
+    assert tracking.get_timestamp("12:30") == 750
+    np.testing.assert_array_equal(
+        tracking.get_frameIDs_from_times(["0:00.4", "0:00.8", "0"]),
+        [10, 20, 0],
+    )
+
+
+def test_pitch_control_surfaces_are_cached(tracking):
+    first = tracking.get_traces(30, pitch_control=True)
+    again = tracking.get_traces(30, pitch_control=True)
+    np.testing.assert_array_equal(first[0].z, again[0].z)
+    stats = tracking.pitch_control_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_matches_sharing_a_cache_dir(tmp_path):
+    # with no room in memory, every surface goes through the spill directory
+    a, b = [
+        TrackingData(*make_match(seed=seed), cache_size=0, cache_dir=tmp_path)
+        for seed in (0, 1)
+    ]
+    a.get_pitch_control(a.data.loc[10])
+    surface = b.get_pitch_control(b.data.loc[10])["PPCFa"]
+    assert b.pitch_control_cache.stats()["disk_hits"] == 0
+    expected = TrackingData(*make_match(seed=1)).get_pitch_control(
+        b.data.loc[10]
+    )
+    np.testing.assert_array_equal(surface, expected["PPCFa"])
+    # the same match does read them back
+    again = TrackingData(*make_match(seed=0), cache_size=0, cache_dir=tmp_path)
+    again.get_pitch_control(again.data.loc[10])
+    assert again.pitch_control_cache.stats()["disk_hits"] == 1
+
+
+def test_team_arrays_from_column_index(tracking):
+    frame_data = tracking.get_frame_data(10)
+    away = tracking.get_team_arrays(frame_data, "Away")
+    assert away.player_ids == tracking.away_players
+    for k, pid in enumerate(away.player_ids):
+        assert away.positions[k, 0] == frame_data[f"{pid}_x"]
+        assert away.velocities[k, 1] == frame_data[f"{pid}_vy"]
+
+
+def test_data_is_a_view_of_the_tensors(tracking):
+    data = tracking.data
+    assert np.shares_memory(
+        data["H00_x"].to_numpy(), tracking.tensors.positions
+    )
+    assert np.shares_memory(
+        data["A03_speed"].to_numpy(), tracking.tensors.speeds
+    )
+    assert list(data.columns[:2]) == ["period_id", "timestamp"]
+    with pytest.raises(ValueError):
+        data.loc[10, "H00_x"] = 999.0
+    # a changed row is plotted and computed as given, but not cached
+    stored = tracking.get_pitch_control(tracking.get_frame_data(10))
+    frame_data = tracking.get_frame_data(10).copy()
+    frame_data["H00_x"] = 40.0
+    assert tracking.position_traces(frame_data)[0].x[0] == 40.0
+    changed = tracking.get_pitch_control(frame_data)
+    assert not np.allclose(changed["PPCFa"], stored["PPCFa"])
+    assert len(tracking.pitch_control_cache) == 1
+    again = tracking.get_pitch_control(tracking.get_frame_data(10))
+    np.testing.assert_array_equal(again["PPCFa"], stored["PPCFa"])
+
+
+def test_individual_player_params(tracking):
+    frame_data = tracking.get_frame_data(12)
+    plain = tracking.get_pitch_control(frame_data)["PPCFa"]
+    tracking.set_player_params({"H03": {"max_player_speed": 9.0}})
+    fast = tracking.get_pitch_control(frame_data)["PPCFa"]
+    assert fast.sum() > plain.sum()
+    batch = tracking.get_pitch_control_surfaces([12])["PPCFa"][0]
+    np.testing.assert_allclose(batch, fast)
+    assert tracking.pitch_control_cache.stats()["hits"] == 0
+
+
+def test_player_pitch_control_trace_by_jersey(tracking):
+    frame_data = tracking.get_frame_data(30)
+    (trace,) = tracking.get_team_pitch_control_traces(frame_data, player_num=5)
+    pax = tracking.get_pitch_control(frame_data, return_individual=True)
+    np.testing.assert_array_equal(trace.z, pax["PPCFa_pax"]["H04"])
+    (by_id,) = tracking.get_team_pitch_control_traces(
+        frame_data, player_num="H04"
+    )
+    np.testing.assert_array_equal(by_id.z, trace.z)
+
+
+def test_fast_pitch_control_mode(tracking):
+    exact = np.asarray(tracking.get_traces(30, pitch_control=True)[0].z)
+    fast = np.asarray(
+        tracking.get_traces(
+            30, pitch_control=True, pitch_control_mode="fast"
+        )[0].z
+    )
+    assert fast.shape == exact.shape
+    # the approximation agrees on who controls the clear-cut cells
+    clear = np.abs(exact - 0.5) > 0.4
+    np.testing.assert_array_equal(fast[clear] > 0.5, exact[clear] > 0.5)
+    with pytest.raises(ValueError):
+        tracking.get_traces(30, pitch_control=True, pitch_control_mode="slow")
+
+
+def test_precompute_resumes_and_serves_plots(tracking, tmp_path, monkeypatch):
+    path = str(tmp_path / "match")
+    compute = tracking.get_pitch_control_surfaces
+    computed = []
+
+    def interrupted(frames, **kwargs):
+        if computed:
+            raise KeyboardInterrupt
+        computed.extend(frames)
+        return compute(frames, **kwargs)
+
+    monkeypatch.setattr(tracking, "get_pitch_control_surfaces", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        tracking.precompute_pitch_control(path, range(10, 30), chunk_size=8)
+    assert computed == list(range(10, 18))
+
+    def resumed(frames, **kwargs):
+        computed.extend(frames)
+        return compute(frames, **kwargs)
+
+    monkeypatch.setattr(tracking, "get_pitch_control_surfaces", resumed)
+    store = tracking.precompute_pitch_control(
+        path, range(10, 30), chunk_size=8
+    )
+    assert computed == list(range(10, 30))
+    assert store.missing() == []
+
+    reader = TrackingData(*make_match())
+    reader.load_pitch_control_store(path)
+    traces = reader.get_traces(25, pitch_control=True)
+    tracking.pitch_control_store = None
+    expected = tracking.get_pitch_control(tracking.get_frame_data(25))
+    np.testing.assert_allclose(traces[0].z, store.get(25)["PPCFa"])
+    np.testing.assert_allclose(traces[0].z, expected["PPCFa"], atol=1e-6)
+    assert reader.pitch_control_cache.stats()["misses"] == 0
+
+    other_match = TrackingData(*make_match(seed=1))
+    with pytest.raises(ValueError):
+        other_match.load_pitch_control_store(path)
+    assert other_match.pitch_control_store is None
+
+
+def test_space_control_matches_surfaces(tracking):
+    frames = range(5, 11)
+    space_control = tracking.get_space_control(frames, chunk_size=4)
+    assert list(space_control.index) == list(frames)
+    assert space_control.shape[1] == 4 + 22
+    cell_area = 106.0 * 68.0 / (50 * 32)
+    player_columns = [c for c in space_control if c[:3] in ("H00", "A00")]
+    assert player_columns == ["H00_area", "A00_area"]
+    for frameID, row in space_control.iterrows():
+        surface = tracking.get_pitch_control(tracking.get_frame_data(frameID))
+        home = surface["PPCFa"].sum() * cell_area
+        assert row["Home_area"] == pytest.approx(home)
+        # every cell is credited to some player of the team controlling it
+        home_players = [f"H{k:02d}_area" for k in range(11)]
+        assert row[home_players].sum() == pytest.approx(home)
+        total = row["Home_area"] + row["Away_area"]
+        assert total == pytest.approx(106.0 * 68.0, rel=0.01)
+        assert 0 < row["Home_final_third"] < row["Home_area"]
+
+    away = tracking.get_space_control(frames, attacking="Away", chunk_size=4)
+    assert list(away.columns) == list(space_control.columns)
+
+
+def test_coordinates_are_normalized_in_one_pass():
+    data, metadata = make_match()
+    tracking = TrackingData(data.copy(), metadata)
+    # the step by step conversion, which also flips the first frame of the
+    # second period
+    expected = tracking.flip_direction(
+        tracking.metric_coords(data.copy()), period=1
+    )
+    columns = [c for c in data.columns if c.endswith(("_x", "_y"))]
+    first_of_second = data.index[data.period_id == 2][0]
+    rows = data.index != first_of_second
+    np.testing.assert_allclose(
+        tracking.data.loc[rows, columns], expected.loc[rows, columns]
+    )
+    np.testing.assert_allclose(
+        tracking.data.loc[first_of_second, columns],
+        -expected.loc[first_of_second, columns],
+    )
+
+    metadata.pitch_dimensions = SimpleNamespace(
+        pitch_length=105.0, pitch_width=68.0
+    )
+    tracking = TrackingData(data.copy(), metadata)
+    assert tracking.field_dimen == (105.0, 68.0)
+    np.testing.assert_allclose(
+        tracking.data.loc[first_of_second, "ball_x"],
+        (data.loc[first_of_second, "ball_x"] - 0.5) * 105.0,
+    )
+
+
+def test_pitch_size_from_metadata_reaches_the_grids():
+    data, metadata = make_match()
+    metadata.pitch_dimensions = SimpleNamespace(
+        pitch_length=90.0, pitch_width=60.0
+    )
+    tracking = TrackingData(data, metadata)
+    surface = tracking.get_pitch_control(tracking.get_frame_data(10))
+    assert surface["xgrid"].max() == 45.0 and surface["ygrid"].max() == 30.0
+    space_control = tracking.get_space_control(range(10, 12))
+    np.testing.assert_allclose(
+        space_control[["Home_area", "Away_area"]].sum(axis=1),
+        90.0 * 60.0,
+        rtol=0.02,
+    )
+    assert tracking.pitch_control_key(10, "Home", 50, {})[3] == (90.0, 60.0)
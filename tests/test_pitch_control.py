@@ -0,0 +1,566 @@
+import subprocess
+import sys
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pitchly.pitch_control import PlayerSurfaces
+from pitchly.pitch_control import SigmoidTable
+from pitchly.pitch_control import TeamArrays
+from pitchly.pitch_control import calculate_pitch_control_at_points
+from pitchly.pitch_control import calculate_pitch_control_at_target
+from pitchly.pitch_control import calculate_pitch_control_at_targets
+from pitchly.pitch_control import default_model_params
+from pitchly.pitch_control import generate_fast_pitch_control_for_frame
+from pitchly.pitch_control import generate_pitch_control_for_frame
+from pitchly.pitch_control import generate_pitch_control_for_frames
+from pitchly.pitch_control import generate_pitch_control_incremental
+from pitchly.pitch_control import generate_pitch_control_sweep
+from pitchly.pitch_control import initialise_players
+from pitchly.pitch_control import param_grid
+from pitchly.pitch_control import pitch_grid
+
+
+def make_frame(seed=0, n_players=11):
+    rng = np.random.default_rng(seed)
+    frame = {}
+    home_cols, away_cols = [], []
+    for team, cols in (("H", home_cols), ("A", away_cols)):
+        for k in range(n_players):
+            pid = f"{team}{k}"
+            frame[f"{pid}_x"] = rng.uniform(-50, 50)
+            frame[f"{pid}_y"] = rng.uniform(-32, 32)
+            frame[f"{pid}_vx"] = rng.normal(0, 3)
+            frame[f"{pid}_vy"] = rng.normal(0, 3)
+            cols.extend(f"{pid}_{s}" for s in ("x", "y", "vx", "vy"))
+    frame["ball_x"] = rng.uniform(-40, 40)
+    frame["ball_y"] = rng.uniform(-25, 25)
+    return pd.Series(frame), home_cols, away_cols
+
+
+def make_tracking(n_frames=4, first_frame=100):
+    frames = [make_frame(seed)[0] for seed in range(n_frames)]
+    data = pd.DataFrame(frames, index=range(first_frame, first_frame + n_frames))
+    home_players = [f"H{k}" for k in range(11)]
+    away_players = [f"A{k}" for k in range(11)]
+    return data, home_players, away_players
+
+
+def test_vectorized_engine_matches_loop():
+    frame, home_cols, away_cols = make_frame()
+    params = default_model_params()
+    for attacking in ("Home", "Away"):
+        kwargs = dict(
+            params=params, attacking=attacking, n_grid_cells_x=24
+        )
+        loop = generate_pitch_control_for_frame(
+            frame, home_cols, away_cols, engine="loop", **kwargs
+        )
+        vec = generate_pitch_control_for_frame(
+            frame, home_cols, away_cols, engine="vectorized", **kwargs
+        )
+        np.testing.assert_allclose(vec["PPCFa"], loop["PPCFa"], atol=1e-9)
+        np.testing.assert_array_equal(vec["xgrid"], loop["xgrid"])
+        np.testing.assert_array_equal(vec["ygrid"], loop["ygrid"])
+
+
+def test_vectorized_engine_ignores_players_out_of_frame():
+    frame, home_cols, away_cols = make_frame(seed=1)
+    frame["H3_x"] = np.nan
+    frame["H3_y"] = np.nan
+    frame["A5_vx"] = np.nan
+    loop = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, n_grid_cells_x=16, engine="loop"
+    )
+    vec = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, n_grid_cells_x=16, return_individual=True
+    )
+    np.testing.assert_allclose(vec["PPCFa"], loop["PPCFa"], atol=1e-9)
+    assert "H3" not in vec["PPCFa_pax"]
+    # cells decided by the time-to-control shortcut have no individual
+    # contributions, everywhere else they add up to the team surface
+    pax_sum = sum(vec["PPCFa_pax"].values())
+    contested = pax_sum > 0
+    assert contested.any()
+    # individual surfaces are stored in single precision
+    np.testing.assert_allclose(
+        pax_sum[contested], vec["PPCFa"][contested], atol=1e-6
+    )
+
+
+def test_individual_surfaces_are_one_float32_array():
+    frame, home_cols, away_cols = make_frame(seed=4)
+    kwargs = dict(attacking="Away", n_grid_cells_x=12, return_individual=True)
+    vec = generate_pitch_control_for_frame(frame, home_cols, away_cols, **kwargs)
+    loop = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, engine="loop", **kwargs
+    )
+    pax = vec["PPCFa_pax"]
+    assert isinstance(pax, PlayerSurfaces)
+    assert pax.surfaces.dtype == np.float32
+    assert pax.surfaces.shape == (11,) + vec["PPCFa"].shape
+    assert list(pax) == [f"A{k}" for k in range(11)]
+    assert np.shares_memory(pax["A4"], pax.surfaces)
+    np.testing.assert_allclose(pax.surfaces, loop["PPCFa_pax"].surfaces)
+    np.testing.assert_array_equal(
+        pax.surface("5", jerseys={"A4": 5, "H4": 5}), pax["A4"]
+    )
+
+
+def test_batch_frames_match_single_frame():
+    data, home_players, away_players = make_tracking()
+    _, home_cols, away_cols = make_frame()
+    batch = generate_pitch_control_for_frames(
+        data, home_players, away_players, range(101, 104), attacking="Away"
+    )
+    assert batch["PPCFa"].shape == (3, 32, 50)
+    assert batch["frames"] == [101, 102, 103]
+    for k, frameID in enumerate(batch["frames"]):
+        single = generate_pitch_control_for_frame(
+            data.loc[frameID], home_cols, away_cols, attacking="Away"
+        )
+        np.testing.assert_allclose(batch["PPCFa"][k], single["PPCFa"])
+
+
+def test_scalar_kernel_does_not_mutate_shared_players():
+    frame, home_cols, away_cols = make_frame(seed=2)
+    params = default_model_params()
+    attacking = initialise_players(frame[home_cols], params)
+    defending = initialise_players(frame[away_cols], params)
+    ball = frame[["ball_x", "ball_y"]].to_list()
+    xgrid, ygrid = pitch_grid(n_grid_cells_x=12)
+    targets = [np.array([x, y]) for y in ygrid for x in xgrid]
+
+    def solve(target):
+        return calculate_pitch_control_at_target(
+            target, attacking, defending, ball, params, return_individual=True
+        )
+
+    serial = [solve(t) for t in targets]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        threaded = list(executor.map(solve, targets))
+    assert threaded == serial
+    assert all(p.PPCF == 0.0 for p in attacking + defending)
+    assert not any(hasattr(p, "time_to_intercept") for p in attacking)
+
+
+def test_player_groups_match_scalar_engine():
+    # four targets with 2, 4, 5 and 11 players in reach, so that the cells
+    # fall in different groups of _PLAYER_GROUP_WIDTH players and 4 and 5
+    # sit on either side of a group boundary. A contested cell always has
+    # at least the nearest player of each team in reach
+    clusters = [(-45.0, 1, 1), (-15.0, 2, 2), (15.0, 3, 2), (45.0, 5, 6)]
+    frame = {}
+    home_cols, away_cols = [], []
+    counts = {"H": 0, "A": 0}
+    for x, n_home, n_away in clusters:
+        for team, n, cols in (
+            ("H", n_home, home_cols),
+            ("A", n_away, away_cols),
+        ):
+            for k in range(n):
+                pid = f"{team}{counts[team]}"
+                counts[team] += 1
+                frame[f"{pid}_x"] = x + (-1) ** k * (0.5 + 0.4 * k)
+                frame[f"{pid}_y"] = 1.0 if team == "H" else -1.5
+                frame[f"{pid}_vx"] = frame[f"{pid}_vy"] = 0.0
+                cols.extend(f"{pid}_{s}" for s in ("x", "y", "vx", "vy"))
+    frame = pd.Series(frame)
+    params = default_model_params()
+    attacking = initialise_players(frame[home_cols], params)
+    defending = initialise_players(frame[away_cols], params)
+    targets = np.array([[x, 0.0] for x, _, _ in clusters])
+    ball = np.array([np.nan, np.nan])
+
+    in_reach = []
+    for target in targets:
+        n = 0
+        for players, side in ((attacking, "att"), (defending, "def")):
+            tti = np.array([p.time_to_intercept_at(target) for p in players])
+            n += (tti - tti.min() < params[f"time_to_control_{side}"]).sum()
+        in_reach.append(n)
+    assert in_reach == [2, 4, 5, 11]
+
+    PPCFatt, PPCFdef = calculate_pitch_control_at_targets(
+        targets,
+        np.array([p.position for p in attacking]),
+        np.array([p.velocity for p in attacking]),
+        np.array([p.position for p in defending]),
+        np.array([p.velocity for p in defending]),
+        ball,
+        params,
+    )
+    for k, target in enumerate(targets):
+        expected = calculate_pitch_control_at_target(
+            target, attacking, defending, ball, params
+        )
+        np.testing.assert_allclose(
+            [PPCFatt[k], PPCFdef[k]], expected, atol=1e-12
+        )
+        assert 0.05 < PPCFatt[k] < 0.95
+
+
+def test_threaded_tiles_and_frames_match_serial():
+    frame, home_cols, away_cols = make_frame(seed=3)
+    serial = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, return_individual=True
+    )
+    tiled = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, return_individual=True, threads=3
+    )
+    np.testing.assert_array_equal(tiled["PPCFa"], serial["PPCFa"])
+    for pid, surface in serial["PPCFa_pax"].items():
+        np.testing.assert_array_equal(tiled["PPCFa_pax"][pid], surface)
+
+    data, home_players, away_players = make_tracking()
+    frames = list(data.index)
+    serial = generate_pitch_control_for_frames(
+        data, home_players, away_players, frames
+    )
+    threaded = generate_pitch_control_for_frames(
+        data, home_players, away_players, frames, threads=2
+    )
+    np.testing.assert_array_equal(threaded["PPCFa"], serial["PPCFa"])
+
+
+def test_team_arrays_match_player_objects():
+    frame, home_cols, _ = make_frame(seed=4)
+    frame["H2_x"] = np.nan
+    params = default_model_params()
+    team = TeamArrays.from_frame(frame, home_cols).in_frame()
+    players = initialise_players(frame[home_cols], params)
+    by_id = {p.id: p for p in players}
+    assert sorted(team.player_ids) == sorted(by_id)
+    for k, pid in enumerate(team.player_ids):
+        np.testing.assert_array_equal(team.positions[k], by_id[pid].position)
+        np.testing.assert_array_equal(team.velocities[k], by_id[pid].velocity)
+    assert team.positions.flags.c_contiguous
+    np.testing.assert_array_equal(
+        team.param("vmax", params), np.full(len(team), 5.0)
+    )
+
+
+@pytest.mark.parametrize(
+    "player_params",
+    [
+        {
+            "H1": {"max_player_speed": 7.0, "reaction_time": 0.5},
+            "H4": {"tti_sigma": 0.3},
+            "A2": {"max_player_speed": 4.0, "tti_sigma": 0.4},
+        },
+        # sigmas above params['tti_sigma'] widen the short-cut thresholds
+        {"H1": {"tti_sigma": 0.9}, "A3": {"tti_sigma": 0.8}},
+    ],
+)
+def test_individual_player_params_match_loop(player_params):
+    frame, home_cols, away_cols = make_frame(seed=5)
+    kwargs = dict(n_grid_cells_x=20, player_params=player_params)
+    loop = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, engine="loop", **kwargs
+    )
+    vec = generate_pitch_control_for_frame(frame, home_cols, away_cols, **kwargs)
+    plain = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, n_grid_cells_x=20
+    )
+    np.testing.assert_allclose(vec["PPCFa"], loop["PPCFa"], atol=1e-9)
+    assert not np.allclose(vec["PPCFa"], plain["PPCFa"])
+
+
+def test_adaptive_grid_close_to_full_grid():
+    frame, home_cols, away_cols = make_frame(seed=7)
+    full = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, n_grid_cells_x=120
+    )
+    adaptive = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, n_grid_cells_x=120, adaptive=True
+    )
+    error = np.abs(adaptive["PPCFa"] - full["PPCFa"])
+    assert error.mean() < 5e-3
+    assert error.max() < 0.05
+    # the coarse lattice is solved exactly
+    np.testing.assert_allclose(
+        adaptive["PPCFa"][::8, ::8], full["PPCFa"][::8, ::8], atol=1e-12
+    )
+
+
+@pytest.mark.parametrize("n_grid_cells_x", [4, 5, 7, 8, 9])
+def test_adaptive_grid_small_grids_are_solved_exactly(n_grid_cells_x):
+    # too few coarse lattice points to estimate the curvature from
+    frame, home_cols, away_cols = make_frame(seed=7)
+    full = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, n_grid_cells_x=n_grid_cells_x
+    )
+    adaptive = generate_pitch_control_for_frame(
+        frame,
+        home_cols,
+        away_cols,
+        n_grid_cells_x=n_grid_cells_x,
+        adaptive=True,
+    )
+    np.testing.assert_allclose(adaptive["PPCFa"], full["PPCFa"], atol=1e-12)
+
+
+def test_memory_budget_tiles_into_preallocated_output():
+    frame, home_cols, away_cols = make_frame(seed=5)
+    kwargs = dict(n_grid_cells_x=120, return_individual=True)
+    full = generate_pitch_control_for_frame(frame, home_cols, away_cols, **kwargs)
+    out = np.empty_like(full["PPCFa"])
+    budget = 2_000_000
+    tracemalloc.start()
+    try:
+        tiled = generate_pitch_control_for_frame(
+            frame, home_cols, away_cols, memory_budget=budget, out=out, **kwargs
+        )
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert tiled["PPCFa"] is out
+    np.testing.assert_array_equal(out, full["PPCFa"])
+    np.testing.assert_array_equal(
+        tiled["PPCFa_pax"].surfaces, full["PPCFa_pax"].surfaces
+    )
+    # the full grid needs several times the budget
+    assert peak < budget + 1_000_000
+    threaded = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, memory_budget=budget, threads=3, **kwargs
+    )
+    np.testing.assert_array_equal(threaded["PPCFa"], full["PPCFa"])
+
+
+def test_exponential_integrator_matches_euler():
+    frame, home_cols, away_cols = make_frame(seed=6)
+    params = default_model_params()
+    exponential = dict(params, integrator="exponential")
+    reference = dict(params, int_dt=0.004)
+    for attacking in ("Home", "Away"):
+        surfaces = [
+            generate_pitch_control_for_frame(
+                frame,
+                home_cols,
+                away_cols,
+                params=p,
+                attacking=attacking,
+                n_grid_cells_x=24,
+            )["PPCFa"]
+            for p in (exponential, reference, params)
+        ]
+        # closer to the small step reference than the default Euler step is
+        assert np.abs(surfaces[0] - surfaces[1]).max() < 0.01
+        assert np.abs(surfaces[0] - surfaces[2]).max() < 0.03
+
+    with pytest.raises(ValueError):
+        generate_pitch_control_for_frame(
+            frame, home_cols, away_cols, params=dict(params, integrator="rk4")
+        )
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+def test_exponential_integrator_passes_checksum_when_all_contested(backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    frame, home_cols, away_cols = make_frame()
+    # no short-cuts, so every cell is integrated. Stopping exactly at
+    # model_converge_tol left the mean total at 1 - tol, which failed the
+    # checksum on rounding
+    params = dict(
+        default_model_params(),
+        integrator="exponential",
+        backend=backend,
+        time_to_control_att=100.0,
+        time_to_control_def=100.0,
+    )
+    # raises on a failed checksum
+    PPCFa = generate_pitch_control_for_frame(
+        frame, home_cols, away_cols, params=params
+    )["PPCFa"]
+    assert 0 < PPCFa.min() and PPCFa.max() < 1
+
+
+def test_sigmoid_table_within_error_bound():
+    z = np.linspace(-40, 40, 400001)
+    exact = 1.0 / (1.0 + np.exp(-z))
+    for step in (0.01, 0.05, 0.2):
+        table = SigmoidTable(step)
+        error = np.abs(table(z) - exact).max()
+        assert error <= table.error_bound
+        # the interpolation bound is tight
+        assert error > 0.5 * table.error_bound
+    assert SigmoidTable().error_bound < 3.1e-5
+
+    frame, home_cols, away_cols = make_frame(seed=7)
+    params = default_model_params()
+    exact, tabulated = [
+        generate_pitch_control_for_frame(
+            frame, home_cols, away_cols, params=p, n_grid_cells_x=24
+        )["PPCFa"]
+        for p in (params, dict(params, sigmoid="table"))
+    ]
+    np.testing.assert_allclose(tabulated, exact, atol=5e-3)
+
+
+def test_points_at_their_own_frames_match_surfaces():
+    data, home_players, away_players = make_tracking()
+    data.loc[102, "H3_x"] = np.nan
+    _, home_cols, away_cols = make_frame()
+    xgrid, ygrid = pitch_grid(n_grid_cells_x=20)
+    rng = np.random.default_rng(0)
+    frames = rng.choice(data.index, size=40)
+    cells = rng.integers(0, (len(ygrid), len(xgrid)), size=(40, 2))
+    targets = np.column_stack([xgrid[cells[:, 1]], ygrid[cells[:, 0]]])
+    PPCFatt, PPCFdef, att_pax, def_pax = calculate_pitch_control_at_points(
+        data,
+        home_players,
+        away_players,
+        targets,
+        frames,
+        attacking="Away",
+        return_individual=True,
+    )
+    assert att_pax.shape == (40, 11) and def_pax.shape == (40, 11)
+    for k, frameID in enumerate(frames):
+        surface = generate_pitch_control_for_frame(
+            data.loc[frameID],
+            home_cols,
+            away_cols,
+            attacking="Away",
+            n_grid_cells_x=20,
+        )["PPCFa"]
+        assert PPCFatt[k] == pytest.approx(surface[tuple(cells[k])], abs=1e-9)
+    np.testing.assert_array_equal(def_pax[frames == 102, 3], 0.0)
+
+    # a shared frame and ball position broadcast to every target
+    ball = np.array([10.0, -5.0])
+    single = calculate_pitch_control_at_points(
+        data, home_players, away_players, targets, 101, ball_start_pos=ball
+    )
+    for k, target in enumerate(targets):
+        frame = data.loc[101]
+        expected = calculate_pitch_control_at_target(
+            target,
+            initialise_players(frame[home_cols], default_model_params()),
+            initialise_players(frame[away_cols], default_model_params()),
+            ball,
+            default_model_params(),
+        )
+        np.testing.assert_allclose(
+            [single[0][k], single[1][k]], expected, atol=1e-9
+        )
+
+
+def test_param_grid_updates_derived_params():
+    param_sets = param_grid(kappa_def=[1.0, 1.72], tti_sigma=[0.3, 0.45])
+    assert len(param_sets) == 4
+    assert [p["kappa_def"] for p in param_sets] == [1.0, 1.0, 1.72, 1.72]
+    assert param_sets[1] == default_model_params()
+    assert param_sets[3]["lambda_def"] == pytest.approx(4.3 * 1.72)
+    assert (
+        param_sets[2]["time_to_control_def"]
+        < param_sets[3]["time_to_control_def"]
+    )
+    assert (
+        param_sets[2]["time_to_control_att"]
+        < param_sets[3]["time_to_control_att"]
+    )
+
+
+def test_sweep_matches_separate_runs():
+    data, home_players, away_players = make_tracking()
+    param_sets = param_grid(
+        reaction_time=[0.5, 0.7], lambda_att=[3.0, 4.3], tti_sigma=[0.45]
+    )
+    param_sets.append(dict(param_sets[0], integrator="exponential"))
+    sweep = generate_pitch_control_sweep(
+        data, home_players, away_players, [100, 102], param_sets
+    )
+    assert sweep["PPCFa"].shape == (5, 2, 32, 50)
+    for s, params in enumerate(param_sets):
+        single = generate_pitch_control_for_frames(
+            data, home_players, away_players, [100, 102], params=params
+        )
+        np.testing.assert_array_equal(sweep["PPCFa"][s], single["PPCFa"])
+
+
+def test_incremental_only_solves_changed_cells():
+    frame = make_frame()[0]
+    moved = frame.copy()
+    moved[["H3_x", "H3_y"]] += 0.5
+    data = pd.DataFrame([frame, moved, moved, frame], index=range(4))
+    home_players = [f"H{k}" for k in range(11)]
+    away_players = [f"A{k}" for k in range(11)]
+    full = generate_pitch_control_for_frames(
+        data, home_players, away_players, data.index
+    )
+    exact = generate_pitch_control_incremental(
+        data, home_players, away_players, data.index, tol=0
+    )
+    np.testing.assert_allclose(exact["PPCFa"], full["PPCFa"], atol=1e-12)
+    n_cells = full["PPCFa"][0].size
+    assert exact["solved"][0] == n_cells
+    assert 0 < exact["solved"][1] < n_cells
+    assert exact["solved"][2] == 0
+    refreshed = generate_pitch_control_incremental(
+        data, home_players, away_players, data.index, tol=0.1, refresh=3
+    )
+    assert refreshed["solved"][3] == n_cells
+    np.testing.assert_allclose(refreshed["PPCFa"], full["PPCFa"], atol=0.1)
+
+
+@pytest.mark.parametrize(
+    "integrator, sigmoid",
+    [("euler", "exact"), ("exponential", "exact"), ("euler", "table")],
+)
+def test_numba_backend_matches_numpy(integrator, sigmoid):
+    pytest.importorskip("numba")
+    data, home_players, away_players = make_tracking()
+    params = dict(
+        default_model_params(), integrator=integrator, sigmoid=sigmoid
+    )
+    surfaces = {
+        backend: generate_pitch_control_for_frames(
+            data,
+            home_players,
+            away_players,
+            data.index,
+            params=dict(params, backend=backend),
+        )
+        for backend in ("numpy", "numba")
+    }
+    np.testing.assert_allclose(
+        surfaces["numba"]["PPCFa"], surfaces["numpy"]["PPCFa"], atol=1e-12
+    )
+
+
+def test_numba_is_imported_on_first_use():
+    code = (
+        "import sys; import pitchly.pitch_control; "
+        "assert 'numba' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_unknown_backend_raises():
+    frame, home_cols, away_cols = make_frame()
+    params = dict(default_model_params(), backend="fortran")
+    with pytest.raises(ValueError):
+        generate_pitch_control_for_frame(
+            frame, home_cols, away_cols, params=params
+        )
+
+
+def test_fast_pitch_control_gives_cells_to_first_arrival():
+    frame, home_cols, away_cols = make_frame()
+    hard = generate_fast_pitch_control_for_frame(
+        frame, home_cols, away_cols, soft=False, return_individual=True
+    )
+    soft = generate_fast_pitch_control_for_frame(frame, home_cols, away_cols)
+    assert set(np.unique(hard["PPCFa"])) <= {0.0, 1.0}
+    decided = hard["PPCFa"] == 1.0
+    assert np.all(soft["PPCFa"][decided] > 0.5)
+    assert np.all(soft["PPCFa"][~decided] < 0.5)
+    # each controlled cell belongs to exactly one attacking player
+    pax = hard["PPCFa_pax"].surfaces
+    np.testing.assert_array_equal(pax.sum(axis=0), hard["PPCFa"])
+    assert pax.max(axis=0)[decided].min() == 1.0
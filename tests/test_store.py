@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from pitchly.store import PitchControlStore
+
+
+def test_store_round_trip(tmp_path):
+    path = str(tmp_path / "store")
+    assert PitchControlStore.open(path) is None
+    xgrid, ygrid = np.arange(4.0), np.arange(3.0)
+    key = ("Home", 4, (106.0, 68.0), "abc")
+    store = PitchControlStore.create(path, [10, 11, 12], xgrid, ygrid, key)
+    assert store.missing() == [10, 11, 12]
+    assert store.get(11) is None
+
+    surfaces = np.stack([np.full((3, 4), 0.2), np.full((3, 4), 0.1)])
+    store.write([12, 10], surfaces)
+    assert 10 in store and 11 not in store
+
+    reopened = PitchControlStore.open(path)
+    assert reopened.key == key
+    assert reopened.missing() == [11]
+    surface = reopened.get(12)
+    assert surface["PPCFa"].dtype == np.float32
+    np.testing.assert_allclose(surface["PPCFa"], 0.2)
+    np.testing.assert_array_equal(surface["xgrid"], xgrid)
+
+    # read-only surfaces can't be changed on disk through get()
+    for opened in (reopened, store):
+        with pytest.raises(ValueError):
+            opened.get(12)["PPCFa"][0, 0] = 1.0
+    with pytest.raises(ValueError):
+        reopened.write([11], np.zeros((1, 3, 4)))
+    np.testing.assert_allclose(
+        PitchControlStore.open(path).get(12)["PPCFa"], 0.2
+    )
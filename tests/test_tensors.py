@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pitchly.tensors import TrackingTensors
+
+
+def make_data(n_frames=5):
+    rng = np.random.default_rng(0)
+    columns = [
+        f"{pid}_{k}"
+        for pid in ("H1", "H2", "A1")
+        for k in ("x", "y", "vx", "vy", "speed")
+    ] + ["ball_x", "ball_y"]
+    return pd.DataFrame(
+        rng.normal(size=(n_frames, len(columns))),
+        index=range(100, 100 + n_frames),
+        columns=columns,
+    )
+
+
+def test_tensors_round_trip():
+    data = make_data()
+    tensors = TrackingTensors.from_dataframe(data, ["H1", "H2", "A1"])
+    assert tensors.positions.shape == (5, 3, 2)
+    assert tensors.speeds.shape == (5, 3)
+    assert tensors.player_index["A1"] == 2
+    frame = tensors.frame(102)
+    assert frame.positions[1, 0] == data.loc[102, "H2_x"]
+    assert frame.velocities[2, 1] == data.loc[102, "A1_vy"]
+    assert frame.ball[0] == data.loc[102, "ball_x"]
+    # frames are views, not copies
+    assert np.shares_memory(frame.positions, tensors.positions)
+    assert tensors.columns(["H1", "H2"]) == slice(0, 2)
+    view = tensors.to_dataframe()
+    pd.testing.assert_frame_equal(view, data[view.columns], check_names=False)
+    # the DataFrame is a view of the arrays
+    assert np.shares_memory(view["H2_x"].to_numpy(), tensors.positions)
+    row = view.loc[102].copy()
+    row["H2_x"] = 99.0
+    row = tensors.frame_from_row(row)
+    assert row.name == 102 and row.positions[1, 0] == 99.0
+    np.testing.assert_array_equal(row.velocities, frame.velocities)
+    with pytest.raises(KeyError):
+        tensors.frame(99)